@@ -0,0 +1,80 @@
+# Times the qmtools geometry kernels on synthetic grids in a plain Python
+# process, no Blender needed.
+#
+#   python benchmarks/bench_core.py [segments ...]
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from qmtools import core
+
+GRID_SEGMENTS = (100, 300, 600, 1000)
+IMAGE_COUNT = 8
+REPEATS = 3
+
+def make_grid(segments, noise=0.01, seed=0):
+    # quad grid on the xy plane with every vertex jittered a little, returns
+    # (co, edges, loop_total, loop_edges)
+    random = np.random.RandomState(seed)
+    side = segments + 1
+
+    x, y = np.meshgrid(np.arange(side), np.arange(side))
+    co = np.stack((x.ravel(), y.ravel(), np.zeros(side * side)), axis=1)
+    co = (co + random.uniform(-noise, noise, co.shape)).astype(np.float32)
+
+    rows, cols = np.meshgrid(np.arange(side), np.arange(segments), indexing='ij')
+    horizontal = np.stack((rows * side + cols, rows * side + cols + 1), axis=-1).reshape(-1, 2)
+    rows, cols = np.meshgrid(np.arange(segments), np.arange(side), indexing='ij')
+    vertical = np.stack((rows * side + cols, (rows + 1) * side + cols), axis=-1).reshape(-1, 2)
+    edges = np.concatenate((horizontal, vertical)).astype(np.int32)
+
+    rows, cols = np.meshgrid(np.arange(segments), np.arange(segments), indexing='ij')
+    bottom = rows * segments + cols
+    top = (rows + 1) * segments + cols
+    left = len(horizontal) + rows * side + cols
+    right = left + 1
+    loop_edges = np.stack((bottom, right, top, left), axis=-1).ravel().astype(np.int32)
+    loop_total = np.full(segments * segments, 4, dtype=np.int32)
+
+    return co, edges, loop_total, loop_edges
+
+def best_time(func):
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or GRID_SEGMENTS
+    print("{:>10} {:<24} {:>10}".format("verts", "kernel", "time"))
+
+    for segments in sizes:
+        co, edges, loop_total, loop_edges = make_grid(segments)
+        names = ["image{}".format(i) for i in range(IMAGE_COUNT)]
+        face_slots = np.random.RandomState(1).randint(0, IMAGE_COUNT, len(loop_total))
+        offsets, neighbours = core.build_face_adjacency(loop_total, loop_edges)
+        index = core.ImageFaceIndex(names, face_slots)
+        axes = (core.X_AXIS_INDEX, core.Y_AXIS_INDEX, core.Z_AXIS_INDEX)
+        multiplier = core.get_grid_multiplier(1.0, 10, on_minor=True)
+
+        kernels = (
+            ("snap_coords_to_grid", lambda: core.snap_coords_to_grid(co, axes, multiplier)),
+            ("align_coords", lambda: core.align_coords(co, axes[:2], co[0])),
+            ("solve_smart_align", lambda: core.solve_smart_align(co, edges)),
+            ("build_face_adjacency", lambda: core.build_face_adjacency(loop_total, loop_edges)),
+            ("ImageFaceIndex", lambda: core.ImageFaceIndex(names, face_slots)),
+            ("select_linked_faces", lambda: core.select_linked_faces(
+                offsets, neighbours, np.arange(len(loop_total)), index.get_faces(names[0]))),
+        )
+
+        for name, func in kernels:
+            print("{:>10} {:<24} {:>9.4f}s".format(len(co), name, best_time(func)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# Times the edit-mesh path of the qmtools operators against the object-mode
+# fallback on grid meshes of increasing size.
+#
+#   blender --background --factory-startup --python benchmarks/bench_edit_mode.py
+
+import os
+import random
+import sys
+import time
+
+import bpy
+import bmesh
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from qmtools import tools
+
+GRID_SEGMENTS = (10, 50, 100, 300, 600)
+REPEATS = 3
+
+class Reporter:
+    def report(self, level, message):
+        print("{}: {}".format(", ".join(level), message))
+
+def make_grid(segments):
+    bm = bmesh.new()
+    bmesh.ops.create_grid(bm, x_segments=segments, y_segments=segments, size=segments)
+    for vert in bm.verts:
+        vert.co.z += random.uniform(-0.01, 0.01)
+
+    mesh = bpy.data.meshes.new("qmtools_bench")
+    bm.to_mesh(mesh)
+    bm.free()
+
+    obj = bpy.data.objects.new("qmtools_bench", mesh)
+    scene = bpy.context.scene
+    if hasattr(scene.objects, "link"):
+        scene.objects.link(obj)
+        scene.objects.active = obj
+    else:
+        scene.collection.objects.link(obj)
+        bpy.context.view_layer.objects.active = obj
+    return obj
+
+def remove_object(obj):
+    mesh = obj.data
+    bpy.data.objects.remove(obj, do_unlink=True)
+    bpy.data.meshes.remove(mesh)
+
+def prepare_selection(obj):
+    bpy.ops.object.mode_set(mode='EDIT')
+    bpy.ops.mesh.select_all(action='SELECT')
+    bm = bmesh.from_edit_mesh(obj.data)
+    bm.verts.ensure_lookup_table()
+    bm.select_history.add(bm.verts[0])
+
+def best_time(func):
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    context = bpy.context
+    operator = Reporter()
+    # time the operations in one go, the chunked runner modal needs a window
+    tools.default_preferences.chunk_threshold = sys.maxsize
+    operations = (
+        ("align_to_active", lambda: tools.align_to_active(
+            operator, context, (tools.X_AXIS_INDEX, tools.Y_AXIS_INDEX))),
+        ("smart_align_edges", lambda: tools.smart_align_selected_edges(operator, context)),
+    )
+
+    print("{:>10} {:<20} {:>12} {:>12} {:>8}".format(
+        "verts", "operation", "edit mesh", "object mode", "ratio"))
+
+    for segments in GRID_SEGMENTS:
+        obj = make_grid(segments)
+        prepare_selection(obj)
+        vert_count = len(bmesh.from_edit_mesh(obj.data).verts)
+
+        for name, func in operations:
+            tools.default_preferences.use_edit_mesh = True
+            edit_time = best_time(func)
+            tools.default_preferences.use_edit_mesh = False
+            object_time = best_time(func)
+
+            print("{:>10} {:<20} {:>11.4f}s {:>11.4f}s {:>7.2f}x".format(
+                vert_count, name, edit_time, object_time, object_time / edit_time))
+
+        bpy.ops.object.mode_set(mode='OBJECT')
+        remove_object(obj)
+
+main()
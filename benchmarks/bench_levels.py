@@ -0,0 +1,266 @@
+# Times every qmtools operator path on synthetic boxy levels and checks the
+# results against a baseline, so slowdowns are caught before a release.
+#
+#   blender --background --factory-startup --python benchmarks/bench_levels.py -- \
+#       [--verts 10000 100000 ...] [--images 16] [--noise 0.01] [--output results.json] \
+#       [--baseline benchmarks/baseline.json] [--tolerance 1.25] [--save-baseline]
+#
+# Without --verts the default sizes are timed. The level for a size is always
+# generated from the same seed, so runs on one machine are comparable.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import bpy
+import bmesh
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from qmtools import tools
+
+LEVEL_VERTS = (10000, 100000, 500000)
+BOX_SUBDIVISIONS = 8
+REPEATS = 3
+SEED = 0
+
+# (unit cube corner, u, v) of every box side, u x v points out of the box
+BOX_SIDES = (
+    ((0, 0, 0), (0, 1, 0), (1, 0, 0)),
+    ((0, 0, 1), (1, 0, 0), (0, 1, 0)),
+    ((0, 0, 0), (1, 0, 0), (0, 0, 1)),
+    ((0, 1, 0), (0, 0, 1), (1, 0, 0)),
+    ((0, 0, 0), (0, 0, 1), (0, 1, 0)),
+    ((1, 0, 0), (0, 1, 0), (0, 0, 1)),
+)
+
+class Reporter:
+    def report(self, level, message):
+        if 'ERROR' in level:
+            print("{}: {}".format(", ".join(level), message))
+
+def parse_args():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(prog="bench_levels")
+    parser.add_argument("--verts", type=int, nargs="+", default=LEVEL_VERTS,
+        help="approximate vertex counts of the generated levels")
+    parser.add_argument("--images", type=int, default=16,
+        help="number of images spread over the box sides")
+    parser.add_argument("--noise", type=float, default=0.01,
+        help="how far knife cut vertices are off the grid")
+    parser.add_argument("--noisy-fraction", type=float, default=0.1,
+        help="fraction of the vertices that are off the grid")
+    parser.add_argument("--object-mode", action="store_true",
+        help="time the object-mode fallback instead of the edit mesh path")
+    parser.add_argument("--output",
+        help="write the results to this JSON file")
+    parser.add_argument("--baseline",
+        help="baseline JSON file to compare the results with")
+    parser.add_argument("--tolerance", type=float, default=1.25,
+        help="slowdown against the baseline that counts as a regression")
+    parser.add_argument("--save-baseline", action="store_true",
+        help="write the results to --baseline instead of comparing with it")
+    return parser.parse_args(argv)
+
+# ==================================================
+# Level generator
+# ==================================================
+
+def make_box_side(subdivisions):
+    # (co, quads) of one subdivided unit square in the uv plane
+    side = subdivisions + 1
+    a, b = np.meshgrid(np.linspace(0, 1, side), np.linspace(0, 1, side), indexing='ij')
+    uv = np.stack((a.ravel(), b.ravel()), axis=1)
+
+    rows, cols = np.meshgrid(np.arange(subdivisions), np.arange(subdivisions), indexing='ij')
+    first = (rows * side + cols).ravel()
+    quads = np.stack((first, first + side, first + side + 1, first + 1), axis=1)
+    return uv, quads
+
+def make_level_arrays(target_verts, images, noise, noisy_fraction, seed=SEED):
+    # boxes of random whole sizes on a grid of lots, with a random image on
+    # every side, returns (co, quads, face_images)
+    random = np.random.RandomState(seed)
+    uv, quads = make_box_side(BOX_SUBDIVISIONS)
+    side_co = np.array([np.add(corner, np.outer(uv[:, 0], u) + np.outer(uv[:, 1], v))
+                        for corner, u, v in BOX_SIDES])
+    box_co = side_co.reshape(-1, 3)
+    box_quads = (quads[None] + (np.arange(len(BOX_SIDES)) * len(uv))[:, None, None]).reshape(-1, 4)
+
+    box_count = max(1, int(round(target_verts / len(box_co))))
+    lots = int(np.ceil(np.sqrt(box_count)))
+    sizes = random.randint(1, 5, (box_count, 3))
+    offsets = np.stack((np.arange(box_count) % lots, np.arange(box_count) // lots,
+                        np.zeros(box_count)), axis=1) * 6
+
+    co = (box_co[None] * sizes[:, None] + offsets[:, None]).reshape(-1, 3)
+    noisy = random.random_sample(len(co)) < noisy_fraction
+    co[noisy] += random.uniform(-noise, noise, (np.count_nonzero(noisy), 3))
+
+    faces = (box_quads[None] + (np.arange(box_count) * len(box_co))[:, None, None]).reshape(-1, 4)
+    side_images = random.randint(0, images, box_count * len(BOX_SIDES))
+    face_images = np.repeat(side_images, len(quads))
+    return co.astype(np.float32), faces.astype(np.int32), face_images
+
+def make_level(target_verts, args):
+    co, faces, face_images = make_level_arrays(target_verts, args.images, args.noise, args.noisy_fraction)
+
+    mesh = bpy.data.meshes.new("qmtools_level")
+    mesh.vertices.add(len(co))
+    mesh.vertices.foreach_set("co", co.ravel())
+    mesh.loops.add(faces.size)
+    mesh.loops.foreach_set("vertex_index", faces.ravel())
+    mesh.polygons.add(len(faces))
+    mesh.polygons.foreach_set("loop_start", np.arange(0, faces.size, 4, dtype=np.int32))
+    mesh.polygons.foreach_set("loop_total", np.full(len(faces), 4, dtype=np.int32))
+    mesh.update(calc_edges=True)
+
+    images = [bpy.data.images.new("qmtools_level_{}".format(i), 8, 8) for i in range(args.images)]
+    slots = np.array([tools.get_image_material_slot(mesh, image) for image in images], dtype=np.int32)
+    mesh.polygons.foreach_set("material_index", slots[face_images])
+
+    obj = bpy.data.objects.new("qmtools_level", mesh)
+    scene = bpy.context.scene
+    if hasattr(scene.objects, "link"):
+        scene.objects.link(obj)
+        scene.objects.active = obj
+    else:
+        scene.collection.objects.link(obj)
+        bpy.context.view_layer.objects.active = obj
+    return obj, images
+
+def remove_level(obj, images):
+    mesh = obj.data
+    bpy.data.objects.remove(obj, do_unlink=True)
+    bpy.data.meshes.remove(mesh)
+    for image in images:
+        bpy.data.images.remove(image)
+    tools.clear_mesh_caches()
+
+# ==================================================
+# Selection setups
+# ==================================================
+
+def select_everything(obj):
+    bpy.ops.mesh.select_all(action='SELECT')
+    set_active_face(obj)
+
+def select_one_face(obj):
+    bpy.ops.mesh.select_all(action='DESELECT')
+    set_active_face(obj).select_set(True)
+
+def set_active_face(obj):
+    bm = bmesh.from_edit_mesh(obj.data)
+    bm.faces.ensure_lookup_table()
+    face = bm.faces[len(bm.faces) // 2]
+    bm.select_history.clear()
+    bm.select_history.add(face)
+    return face
+
+# ==================================================
+# Timing
+# ==================================================
+
+def time_operation(obj, setup, func):
+    # (first run, best run), the first one runs with cold caches
+    times = []
+    for _ in range(REPEATS):
+        bpy.ops.object.mode_set(mode='EDIT')
+        setup(obj)
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times[0], min(times)
+
+def get_operations(context, images):
+    operator = Reporter()
+    axes = (tools.X_AXIS_INDEX, tools.Y_AXIS_INDEX, tools.Z_AXIS_INDEX)
+    # the selection setups come first, grid snap and the aligns move vertices
+    return (
+        ("select_same_image", select_one_face,
+            lambda: tools.select_faces_with_same_image(operator, context, False)),
+        ("select_same_image_linked", select_one_face,
+            lambda: tools.select_faces_with_same_image(operator, context, True)),
+        ("assign_image", select_everything,
+            lambda: tools.assign_image_to_selected_faces(operator, context, images[0])),
+        ("align_to_active", select_everything,
+            lambda: tools.align_to_active(operator, context, axes[:1])),
+        ("smart_align_edges", select_everything,
+            lambda: tools.smart_align_selected_edges(operator, context)),
+        ("grid_snap", select_everything,
+            lambda: tools.align_to_grid_on_axes(operator, context, axes, True, 1.0, 10)),
+    )
+
+def run(args):
+    context = bpy.context
+    # time the operations in one go, the chunked runner modal needs a window
+    tools.default_preferences.chunk_threshold = sys.maxsize
+    tools.default_preferences.use_edit_mesh = not args.object_mode
+
+    results = {}
+    print("{:>10} {:<26} {:>10} {:>10}".format("verts", "operation", "first", "best"))
+    for target_verts in args.verts:
+        obj, images = make_level(target_verts, args)
+        verts = len(obj.data.vertices)
+        level = results[str(target_verts)] = {"verts": verts, "faces": len(obj.data.polygons), "timings": {}}
+
+        for name, setup, func in get_operations(context, images):
+            first, best = time_operation(obj, setup, func)
+            level["timings"][name] = {"first": first, "best": best}
+            print("{:>10} {:<26} {:>9.4f}s {:>9.4f}s".format(verts, name, first, best))
+
+        bpy.ops.object.mode_set(mode='OBJECT')
+        remove_level(obj, images)
+
+    return {
+        "blender": bpy.app.version_string,
+        "edit_mesh": not args.object_mode,
+        "images": args.images,
+        "noise": args.noise,
+        "noisy_fraction": args.noisy_fraction,
+        "levels": results,
+    }
+
+# ==================================================
+# Baseline
+# ==================================================
+
+def find_regressions(results, baseline, tolerance):
+    # (level, operation, baseline seconds, seconds) of every best time that
+    # got slower than the tolerance allows
+    regressions = []
+    for level, timings in sorted(results["levels"].items()):
+        base_timings = baseline["levels"].get(level, {}).get("timings", {})
+        for name, timing in sorted(timings["timings"].items()):
+            if name in base_timings and timing["best"] > base_timings[name]["best"] * tolerance:
+                regressions.append((level, name, base_timings[name]["best"], timing["best"]))
+    return regressions
+
+def write_json(path, data):
+    with open(path, "w") as json_file:
+        json.dump(data, json_file, indent=2, sort_keys=True)
+
+def main():
+    args = parse_args()
+    results = run(args)
+
+    if args.output:
+        write_json(args.output, results)
+
+    if args.baseline and args.save_baseline:
+        write_json(args.baseline, results)
+        print("baseline written to {}".format(args.baseline))
+    elif args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for level, name, before, after in regressions:
+            print("REGRESSION {} verts {}: {:.4f}s -> {:.4f}s ({:.2f}x)".format(
+                level, name, before, after, after / before))
+        if regressions:
+            sys.exit(1)
+        print("no regressions against {}".format(args.baseline))
+
+main()
@@ -0,0 +1,44 @@
+# Times how long enabling Quick Map Tools takes, and what the first operator
+# run pays for loading the tool functions afterwards.
+#
+#   blender --background --factory-startup --python benchmarks/bench_startup.py
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+def main():
+    numpy_preloaded = "numpy" in sys.modules
+
+    qmtools, import_time = timed(lambda: __import__("qmtools"))
+    _, register_time = timed(qmtools.register)
+    tools_at_enable = "qmtools.tools" in sys.modules
+    numpy_at_enable = "numpy" in sys.modules and not numpy_preloaded
+
+    # the first attribute access is what the first operator run pays
+    _, first_load_time = timed(lambda: qmtools.ui.tools.get_preferences)
+    _, unregister_time = timed(qmtools.unregister)
+
+    print("{:<28} {:>10}".format("step", "time"))
+    for name, seconds in (
+            ("import qmtools", import_time),
+            ("register", register_time),
+            ("enable total", import_time + register_time),
+            ("first tools load", first_load_time),
+            ("unregister", unregister_time)):
+        print("{:<28} {:>9.2f}ms".format(name, seconds * 1000))
+
+    print("tools loaded at enable: {}".format("yes" if tools_at_enable else "no"))
+    if numpy_preloaded:
+        print("numpy loaded at enable: already imported by Blender")
+    else:
+        print("numpy loaded at enable: {}".format("yes" if numpy_at_enable else "no"))
+
+main()
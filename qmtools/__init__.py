@@ -0,0 +1,50 @@
+# Quick Map Tools - Blender Plugin
+# Copyright (C) 2018 John Cruz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# The addon is split in three modules:
+#
+#   ui     menu, operators, preferences and panels, loaded when the addon is enabled
+#   tools  mesh snapshots, caches and the functions behind the operators,
+#          loaded the first time an operator runs
+#   core   numpy kernels without bpy, also usable from plain Python
+#
+# Nothing is imported here so qmtools.core can be imported outside of Blender.
+
+# ================================================== 
+# bl_info
+# ==================================================
+
+bl_info = {
+    "name": "Quick Map Tools",
+    "description": "Additional tools for geometry alignment and texturing to speed up the task of building game levels",
+    "category": "Mesh",
+    "author": "John Cruz",
+    "version": (1, 0),
+    "blender": (2, 78, 0),
+    "support": "TESTING",
+}
+
+# ================================================== 
+# Registration
+# ================================================== 
+
+def register():
+    from . import ui
+    ui.register()
+
+def unregister():
+    from . import ui
+    ui.unregister()
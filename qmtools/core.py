@@ -0,0 +1,599 @@
+# Quick Map Tools - geometry kernels
+# Copyright (C) 2018 John Cruz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# The geometry maths behind the qmtools operators. Everything here works on
+# plain numpy coordinate, edge and face arrays and must not import bpy or
+# bmesh, so it can be profiled and reused outside of Blender.
+
+# ================================================== 
+# Imports
+# ================================================== 
+
+import math
+import numpy as np
+
+# ================================================== 
+# constants / data
+# ================================================== 
+
+X_AXIS_INDEX = 0
+Y_AXIS_INDEX = 1
+Z_AXIS_INDEX = 2
+
+# the (u, v) axes of a cube projection along x, y and z, same as Blender's
+cube_uv_axes = np.array([[Y_AXIS_INDEX, Z_AXIS_INDEX], [X_AXIS_INDEX, Z_AXIS_INDEX], [X_AXIS_INDEX, Y_AXIS_INDEX]])
+
+# odd 64 bit multipliers for hashing int rows
+hash_factors = np.array([-7046029254386353131, -4658895280553007687, 7319936632422683443], dtype=np.int64)
+
+# ================================================== 
+# Grid and alignment
+# ==================================================
+
+def get_grid_multiplier(grid_scale, grid_subdivisions, on_minor):
+    return (grid_subdivisions if on_minor else 1) / grid_scale
+
+def snap_coords_to_grid(coords, axes, multiplier, matrix=None):
+    # matrix takes coords into the space the grid is axis aligned in, the
+    # snapped coords are taken back with its inverse
+    axes = list(axes)
+    coords = coords.astype(np.float64)
+    if matrix is not None:
+        coords = transform_coords(matrix, coords)
+    coords[:, axes] = np.round(coords[:, axes] * multiplier) / multiplier
+    if matrix is not None:
+        coords = transform_coords(np.linalg.inv(np.asarray(matrix, dtype=np.float64)), coords)
+    return coords
+
+def align_coords(coords, axes, target, matrix=None):
+    # target is in the space matrix takes coords into, like snap_coords_to_grid()
+    axes = list(axes)
+    coords = coords.astype(np.float64)
+    if matrix is not None:
+        coords = transform_coords(matrix, coords)
+    coords[:, axes] = [target[axis] for axis in axes]
+    if matrix is not None:
+        coords = transform_coords(np.linalg.inv(np.asarray(matrix, dtype=np.float64)), coords)
+    return coords
+
+def find_coincident_verts(co, verts, axes=(X_AXIS_INDEX, Y_AXIS_INDEX, Z_AXIS_INDEX), multiplier=None, matrix=None):
+    # (duplicates, targets) for every vertex at the same position as a lower
+    # numbered one, limited to positions one of verts is at. With a grid
+    # multiplier verts were just snapped and are compared as grid points on
+    # the given axes, in the space matrix takes co into, so float rounding
+    # can't keep them apart. The other vertices never moved and only match
+    # when they already sit on the grid point.
+    candidates = np.arange(len(co))
+    if multiplier is not None:
+        on_grid = get_on_grid_mask(co, axes, multiplier, matrix)
+        on_grid[verts] = True
+        candidates = np.flatnonzero(on_grid)
+
+    keys = get_position_keys(co[candidates], axes, multiplier, matrix)
+    count = len(keys)
+    if count == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    # the lowest numbered vertex of every group of equal keys
+    firsts = get_first_equal_rows(keys)
+    lowest = np.full(count, count, dtype=np.int64)
+    np.minimum.at(lowest, firsts, np.arange(count))
+    owners = lowest[firsts]
+
+    involved = np.zeros(count, dtype=bool)
+    involved[owners[np.searchsorted(candidates, verts)]] = True
+    duplicates = np.flatnonzero((owners != np.arange(count)) & involved[owners])
+    return candidates[duplicates], candidates[owners[duplicates]]
+
+def get_position_keys(co, axes, multiplier=None, matrix=None):
+    # int64 rows equal for equal positions, the grid point on the axes when
+    # there is a multiplier and the exact coordinate bits otherwise
+    coords = co.astype(np.float64)
+    if matrix is not None:
+        coords = transform_coords(matrix, coords)
+    keys = (coords + 0.0).view(np.int64).copy()  # -0.0 -> 0.0
+    if multiplier is not None:
+        axes = list(axes)
+        keys[:, axes] = np.round(coords[:, axes] * multiplier).astype(np.int64)
+    return keys
+
+def get_on_grid_mask(co, axes, multiplier, matrix=None):
+    # rows of co on a grid point on the given axes, give or take the few
+    # float32 steps that storing and transforming them costs
+    coords = co.astype(np.float64)
+    if matrix is not None:
+        coords = transform_coords(matrix, coords)
+    coords = coords[:, list(axes)]
+    offsets = np.abs(np.round(coords * multiplier) / multiplier - coords)
+    rounding = 4 * np.spacing(np.abs(coords).astype(np.float32))
+    return (offsets <= rounding).all(axis=1)
+
+def get_value_clusters(values, tolerance):
+    # Sorted values closer than tolerance to their neighbour share a cluster,
+    # but a cluster spans no more than tolerance: a value further than that
+    # from the first one of its cluster starts the next, so a gentle ramp
+    # is not chained into one value. Returns (cluster label of every value,
+    # sorting order, cluster starts in that order).
+    order = np.argsort(values, kind='mergesort')
+    ordered = values[order]
+    breaks = np.ones(len(ordered), dtype=bool)
+    breaks[1:] = np.diff(ordered) > tolerance
+
+    # only the chains wider than tolerance need splitting, one cluster at a
+    # time. The first value past tolerance never lies beyond its chain.
+    starts = np.flatnonzero(breaks)
+    ends = np.append(starts[1:], len(ordered))
+    wide = ordered[ends - 1] - ordered[starts] > tolerance
+    if wide.any():
+        nexts = np.searchsorted(ordered, ordered + tolerance, side='right').tolist()
+        cuts = []
+        for start, end in zip(starts[wide].tolist(), ends[wide].tolist()):
+            start = nexts[start]
+            while start < end:
+                cuts.append(start)
+                start = nexts[start]
+        breaks[cuts] = True
+
+    labels = np.empty(len(values), dtype=np.int64)
+    labels[order] = np.cumsum(breaks) - 1
+    return labels, order, np.flatnonzero(breaks)
+
+def cluster_coords(coords, axes, tolerance, multiplier=None, matrix=None):
+    # moves every cluster of near-equal values on each axis to its mean, or
+    # the grid line closest to it, returns (coords, clusters collapsed).
+    # matrix works like in snap_coords_to_grid(), the axes and tolerance are
+    # those of the space it takes coords into.
+    coords = coords.astype(np.float64)
+    collapsed = 0
+    if len(coords) == 0:
+        return coords, collapsed
+    if matrix is not None:
+        coords = transform_coords(matrix, coords)
+
+    for axis in axes:
+        values = coords[:, axis]
+        labels, order, starts = get_value_clusters(values, tolerance)
+        targets = np.bincount(labels, values) / np.bincount(labels)
+        if multiplier is not None:
+            targets = np.round(targets * multiplier) / multiplier
+
+        ends = np.append(starts[1:], len(values)) - 1
+        collapsed += int(np.count_nonzero(values[order[ends]] > values[order[starts]]))
+        coords[:, axis] = targets[labels]
+    if matrix is not None:
+        coords = transform_coords(np.linalg.inv(np.asarray(matrix, dtype=np.float64)), coords)
+    return coords, collapsed
+
+def transform_coords(matrix, co):
+    matrix = np.asarray(matrix, dtype=np.float64)
+    return co.dot(matrix[:3, :3].T) + matrix[:3, 3]
+
+def transform_normals(matrix, normals):
+    # inverse transpose, so non-uniform scale keeps normals perpendicular
+    matrix = np.linalg.inv(np.asarray(matrix, dtype=np.float64)[:3, :3])
+    return normals.dot(matrix)
+
+# ================================================== 
+# Smart align
+# ==================================================
+
+def get_dominant_axes(deltas):
+    # index of the longest component of each row, ties go to x, then y
+    return np.argmax(np.abs(deltas), axis=1)
+
+def get_union_find_labels(count, pairs):
+    # connected components of count nodes joined by pairs, every node is
+    # labelled with the smallest node of its component
+    labels = np.arange(count)
+    first, second = pairs[:, 0], pairs[:, 1]
+    while True:
+        label1, label2 = labels[first], labels[second]
+        joined = label1 != label2
+        if not joined.any():
+            return labels
+        np.minimum.at(labels, np.maximum(label1, label2)[joined], np.minimum(label1, label2)[joined])
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+
+def solve_smart_align(co, edges, angle_tolerance=None):
+    # Straightens every edge along its dominant axis. For each coordinate
+    # axis the vertices joined by edges running along one of the other axes
+    # are grouped, and every group is moved to its mean on that coordinate,
+    # so chains and outlines come out the same whatever the edge order.
+    # Returns the touched vertices and their new coordinates.
+    verts, edges = np.unique(edges, return_inverse=True)
+    edges = edges.reshape(-1, 2)
+    coords = co[verts].astype(np.float64)
+
+    deltas = coords[edges[:, 1]] - coords[edges[:, 0]]
+    dominant = get_dominant_axes(deltas)
+
+    if angle_tolerance is not None:
+        lengths = np.linalg.norm(deltas, axis=1)
+        along = np.abs(deltas[np.arange(len(deltas)), dominant])
+        straight = along >= lengths * math.cos(angle_tolerance)
+        edges, dominant = edges[straight], dominant[straight]
+
+    for axis in (X_AXIS_INDEX, Y_AXIS_INDEX, Z_AXIS_INDEX):
+        across = edges[dominant != axis]
+        if len(across) == 0:
+            continue
+        groups = np.unique(get_union_find_labels(len(verts), across), return_inverse=True)[1]
+        means = np.bincount(groups, coords[:, axis]) / np.bincount(groups)
+        coords[:, axis] = means[groups]
+
+    return verts, coords
+
+# ================================================== 
+# Audit
+# ==================================================
+
+def find_near_axis_edges(co, edges, angle_tolerance):
+    # mask of the edges within angle_tolerance of their dominant axis (the
+    # solve_smart_align rule) that are still off it by more than float32
+    # rounding
+    ends = co[edges].astype(np.float64)
+    deltas = ends[:, 1] - ends[:, 0]
+    dominant = get_dominant_axes(deltas)
+    lengths = np.linalg.norm(deltas, axis=1)
+    along = np.abs(deltas[np.arange(len(deltas)), dominant])
+    across = np.sqrt(np.maximum(lengths ** 2 - along ** 2, 0.0))
+    rounding = np.spacing(np.abs(ends).max(axis=(1, 2)).astype(np.float32))
+    return (across > rounding) & (along >= lengths * math.cos(angle_tolerance))
+
+def find_near_grid_coords(co, multiplier, tolerance, matrix=None):
+    # mask of the coordinates closer than tolerance to a grid line that are
+    # still off it by more than float32 rounding, measured in the space
+    # matrix takes co into like in snap_coords_to_grid()
+    if matrix is not None:
+        co = transform_coords(matrix, co.astype(np.float64))
+    offsets = np.abs(snap_coords_to_grid(co, (X_AXIS_INDEX, Y_AXIS_INDEX, Z_AXIS_INDEX), multiplier) - co)
+    rounding = np.spacing(np.abs(co).astype(np.float32))
+    return (offsets > rounding) & (offsets <= tolerance)
+
+def snap_near_grid_coords(co, multiplier, tolerance, matrix=None):
+    # snaps only the coordinates find_near_grid_coords() flags, returns the
+    # touched vertices and their new coordinates
+    mask = find_near_grid_coords(co, multiplier, tolerance, matrix)
+    verts = np.flatnonzero(mask.any(axis=1))
+    coords = co[verts].astype(np.float64)
+    if matrix is not None:
+        coords = transform_coords(matrix, coords)
+    snapped = snap_coords_to_grid(coords, (X_AXIS_INDEX, Y_AXIS_INDEX, Z_AXIS_INDEX), multiplier)
+    coords = np.where(mask[verts], snapped, coords)
+    if matrix is not None:
+        coords = transform_coords(np.linalg.inv(np.asarray(matrix, dtype=np.float64)), coords)
+    return verts, coords
+
+# ================================================== 
+# Face adjacency
+# ==================================================
+
+def build_face_adjacency(loop_total, loop_edges):
+    # CSR face adjacency (offsets, neighbours) from the edge of every loop:
+    # faces are neighbours when they share an edge. Non-manifold edges link
+    # every pair of faces around them.
+    face_count = len(loop_total)
+    loop_faces = np.repeat(np.arange(face_count, dtype=np.int32), loop_total)
+
+    order = np.argsort(loop_edges, kind='mergesort')
+    edges = loop_edges[order]
+    faces = loop_faces[order]
+
+    pairs = []
+    step = 1
+    while step < len(edges):
+        shared = np.flatnonzero(edges[step:] == edges[:-step])
+        if len(shared) == 0:
+            break
+        pairs.append((faces[shared], faces[shared + step]))
+        step += 1
+
+    if pairs:
+        first = np.concatenate([a for a, b in pairs])
+        second = np.concatenate([b for a, b in pairs])
+        links = np.concatenate((
+            first.astype(np.int64) * face_count + second,
+            second.astype(np.int64) * face_count + first))
+        links.sort()
+        links = links[np.concatenate(([True], links[1:] != links[:-1]))]
+        source, target = links // face_count, links % face_count
+        keep = source != target
+        source, target = source[keep], target[keep]
+    else:
+        source = target = np.empty(0, dtype=np.int64)
+
+    offsets = np.zeros(face_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(source, minlength=face_count), out=offsets[1:])
+    return offsets, target.astype(np.int32)
+
+def flood_fill_faces(offsets, neighbours, seeds, allowed):
+    # breadth first search over the CSR index that only enters allowed
+    # faces, each face is visited once
+    visited = np.zeros(len(allowed), dtype=bool)
+    owner = np.empty(len(allowed), dtype=np.int64)
+
+    frontier = seeds[allowed[seeds]]
+    visited[frontier] = True
+
+    while len(frontier):
+        starts = offsets[frontier]
+        counts = offsets[frontier + 1] - starts
+        runs = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        found = neighbours[runs + np.arange(len(runs))]
+        found = found[allowed[found] & ~visited[found]]
+
+        # drop duplicates in linear time, the last writer of each face wins
+        order = np.arange(len(found))
+        owner[found] = order
+        frontier = found[owner[found] == order]
+        visited[frontier] = True
+
+    return visited
+
+# ================================================== 
+# UV islands
+# ==================================================
+
+def get_uv_islands(loop_start, loop_total, loop_verts, loop_uv):
+    # island id of every face, faces are in one island when they share a
+    # vertex that has the same uv in both of them
+    face_count = len(loop_total)
+    loops, owners, firsts = get_face_loops(loop_start, loop_total, np.arange(face_count))
+    if len(loops) == 0:
+        return np.zeros(0, dtype=np.int32)
+
+    # every loop is joined to the first loop with the same vertex and uv
+    keys = np.empty((len(loops), 3), dtype=np.int32)
+    keys[:, 0] = loop_verts[loops]
+    keys[:, 1:] = (loop_uv[loops].astype(np.float32) + np.float32(0.0)).view(np.int32)  # -0.0 -> 0.0
+    pairs = np.stack((owners, owners[get_first_equal_rows(keys)]), axis=1)
+
+    labels = get_union_find_labels(face_count, pairs[pairs[:, 0] != pairs[:, 1]])
+    return np.unique(labels, return_inverse=True)[1].ravel().astype(np.int32)
+
+def get_first_equal_rows(keys):
+    # index of some row equal to each row of an int array, the same one for
+    # all equal rows. Rows are grouped by a 64 bit hash, which is a lot faster
+    # to sort than the rows, a hash collision falls back to sorting the rows.
+    mixed = np.zeros(len(keys), dtype=np.int64)
+    with np.errstate(over='ignore'):
+        for column, factor in zip(keys.T, hash_factors):
+            mixed ^= column.astype(np.int64) * factor
+
+    order = np.argsort(mixed)
+    starts = np.empty(len(order), dtype=bool)
+    starts[0] = True
+    sorted_mixed = mixed[order]
+    np.not_equal(sorted_mixed[1:], sorted_mixed[:-1], out=starts[1:])
+    groups = np.empty(len(order), dtype=np.int64)
+    groups[order] = np.cumsum(starts) - 1
+    firsts = order[starts][groups]
+
+    if not np.array_equal(keys[firsts], keys):
+        rows = np.ascontiguousarray(keys).view(np.dtype((np.void, keys.itemsize * keys.shape[1]))).ravel()
+        unique, index, groups = np.unique(rows, return_index=True, return_inverse=True)
+        firsts = index[groups.ravel()]
+    return firsts
+
+def select_island_faces(islands, seeds, faces):
+    # the given faces that are in an island with one of the seeds
+    seeded = np.zeros(len(islands) and int(islands.max()) + 1, dtype=bool)
+    seeded[islands[seeds]] = True
+    return faces[seeded[islands[faces]]]
+
+# ================================================== 
+# Image index
+# ==================================================
+
+class ImageFaceIndex:
+    # Inverted index from image name (None for faces without an image) to
+    # the sorted indices of the faces using it, for one mesh. Kept current
+    # by reassign() when faces get a new image.
+
+    def __init__(self, slot_names, face_slots):
+        # face_slots indexes slot_names, several slots may share one name
+        self.slots = {}
+        remap = np.array([self.slots.setdefault(name, len(self.slots)) for name in slot_names], dtype=np.int32)
+        self.face_slots = remap[face_slots]
+
+        order = np.argsort(self.face_slots, kind='mergesort').astype(np.int32)
+        bounds = np.searchsorted(self.face_slots[order], np.arange(len(self.slots) + 1))
+        self.faces = {slot: order[bounds[slot]:bounds[slot + 1]] for slot in range(len(self.slots))}
+
+    def __len__(self):
+        return len(self.face_slots)
+
+    def get_faces(self, name):
+        slot = self.slots.get(name)
+        return self.faces[slot] if slot is not None else np.empty(0, dtype=np.int32)
+
+    def count(self, name):
+        return len(self.get_faces(name))
+
+    def reassign(self, indices, name):
+        slot = self.slots.setdefault(name, len(self.slots))
+        previous = np.unique(self.face_slots[indices])
+        self.face_slots[indices] = slot
+
+        for old_slot in previous.tolist():
+            if old_slot != slot:
+                self.faces[old_slot] = np.setdiff1d(self.faces[old_slot], indices, assume_unique=True)
+        self.faces[slot] = np.union1d(self.faces.get(slot, indices), indices).astype(np.int32)
+
+def select_linked_faces(offsets, neighbours, seeds, faces):
+    # faces reachable from the seeds without leaving the given faces
+    allowed = np.zeros(len(offsets) - 1, dtype=bool)
+    allowed[faces] = True
+    return np.flatnonzero(flood_fill_faces(offsets, neighbours, seeds, allowed))
+
+# ================================================== 
+# Cube projection
+# ==================================================
+
+def get_face_loops(loop_start, loop_total, faces):
+    # (loop indices of the faces, position in faces of each loop's face,
+    # position in the loop indices of each face's first loop)
+    totals = loop_total[faces]
+    firsts = np.cumsum(totals) - totals
+    owners = np.repeat(np.arange(len(faces)), totals)
+    loops = (loop_start[faces] - firsts)[owners] + np.arange(len(owners))
+    return loops, owners, firsts
+
+def get_projection_axes(normals):
+    # axis of the largest normal component, ties go to z then y like Blender
+    return 2 - np.argmax(np.abs(normals)[:, ::-1], axis=1)
+
+def get_cube_projection(co, normals, loop_verts, owners):
+    # unscaled uv of every loop, co and normals in the space to project in
+    uv_axes = cube_uv_axes[get_projection_axes(normals)][owners]
+    return co[loop_verts[:, None], uv_axes]
+
+def scale_cube_projection(base, owners, firsts, cube_size):
+    # the uv.cube_project formula, so a cube_size gives the same texel
+    # density as Blender's operator
+    uvs = 0.5 + 0.5 * cube_size * base
+    # move every face by whole tiles so its first loop is in the 0-1 tile
+    uvs -= np.floor(uvs[firsts])[owners]
+    return uvs.astype(np.float32)
+
+# ================================================== 
+# Image usage
+# ==================================================
+
+def get_face_vector_areas(co, loop_start, loop_total, loop_verts):
+    # half the summed cross products of consecutive corners of every face,
+    # its length is the face area. Unlike the area it can be taken to
+    # another space, see transform_vector_areas.
+    loops, owners, firsts = get_face_loops(loop_start, loop_total, np.arange(len(loop_total)))
+    if len(loops) == 0:
+        return np.zeros((0, 3))
+    corners = co[loop_verts[loops]].astype(np.float64)
+    nexts = np.arange(1, len(loops) + 1)
+    nexts[firsts + loop_total - 1] = firsts
+    return 0.5 * np.add.reduceat(np.cross(corners, corners[nexts]), firsts)
+
+def transform_vector_areas(matrix, vector_areas):
+    # the normal matrix scaled by the determinant (the cofactor matrix)
+    determinant = np.linalg.det(np.asarray(matrix, dtype=np.float64)[:3, :3])
+    if determinant == 0:
+        return np.zeros_like(vector_areas)
+    return transform_normals(matrix, vector_areas) * determinant
+
+def get_image_usage(face_slots, areas, slot_count):
+    # (faces, summed area) of every slot
+    return (np.bincount(face_slots, minlength=slot_count),
+            np.bincount(face_slots, weights=areas, minlength=slot_count))
+
+# ================================================== 
+# Batching
+# ==================================================
+
+def get_submesh(loop_start, loop_total, loop_verts, faces):
+    # (vertices, loops, loop_total and vertex of every loop) of a mesh made
+    # of only the given faces, with its vertices numbered in original order
+    loops, owners, firsts = get_face_loops(loop_start, loop_total, faces)
+    verts, submesh_loop_verts = np.unique(loop_verts[loops], return_inverse=True)
+    return verts, loops, loop_total[faces], submesh_loop_verts.astype(np.int32)
+
+def get_reversed_loops(loop_total):
+    # index that reverses the loop order of every face, which flips them
+    firsts = np.cumsum(loop_total) - loop_total
+    owners = np.repeat(np.arange(len(loop_total)), loop_total)
+    return 2 * firsts[owners] + loop_total[owners] - 1 - np.arange(len(owners))
+
+def merge_submeshes(parts):
+    # parts of (co, loop_total, loop_verts, loop_uv or None, face_smooth) ->
+    # one part holding them all. Parts without loop uvs get zero uvs when
+    # others have them, so one part can't drop the uvs of the rest.
+    vert_offsets = np.cumsum([0] + [len(part[0]) for part in parts[:-1]])
+    co = np.concatenate([part[0] for part in parts])
+    loop_total = np.concatenate([part[1] for part in parts])
+    loop_verts = np.concatenate([part[2] + offset for part, offset in zip(parts, vert_offsets)])
+    face_smooth = np.concatenate([part[4] for part in parts])
+    if all(part[3] is None for part in parts):
+        return co, loop_total, loop_verts, None, face_smooth
+    loop_uv = np.concatenate([part[3] if part[3] is not None else np.zeros((len(part[2]), 2), dtype=np.float32)
+                              for part in parts])
+    return co, loop_total, loop_verts, loop_uv, face_smooth
+
+# ================================================== 
+# Texel density
+# ==================================================
+
+def get_face_uv_areas(loop_start, loop_total, loop_uv):
+    # uv area of every face, shoelace formula
+    loops, owners, firsts = get_face_loops(loop_start, loop_total, np.arange(len(loop_total)))
+    if len(loops) == 0:
+        return np.zeros(0)
+    uv = loop_uv[loops].astype(np.float64)
+    nexts = np.arange(1, len(loops) + 1)
+    nexts[firsts + loop_total - 1] = firsts
+    return 0.5 * np.abs(np.add.reduceat(uv[:, 0] * uv[nexts, 1] - uv[nexts, 0] * uv[:, 1], firsts))
+
+def get_texel_densities(areas, uv_areas, texels):
+    # texels per unit of length of every face, nan where the face has no
+    # area or no image with pixels
+    valid = (areas > 0) & (texels > 0)
+    densities = np.full(len(areas), np.nan)
+    densities[valid] = np.sqrt(uv_areas[valid] * texels[valid] / areas[valid])
+    return densities
+
+def get_density_histogram(densities, areas):
+    # (faces, area, bin edges) with one bin per doubling of density, over
+    # the faces with a density above 0
+    valid = np.zeros(len(densities), dtype=bool)
+    np.greater(densities, 0, out=valid, where=np.isfinite(densities))
+    if not valid.any():
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+    densities, areas = densities[valid], areas[valid]
+
+    octaves = np.floor(np.log2(densities))
+    edges = 2.0 ** np.arange(octaves.min(), octaves.max() + 2)
+    return np.histogram(densities, edges)[0], np.histogram(densities, edges, weights=areas)[0], edges
+
+def get_weighted_median(values, weights):
+    # nan when no value has weight
+    valid = np.isfinite(values) & (weights > 0)
+    if not valid.any():
+        return np.nan
+    order = np.argsort(values[valid])
+    cumulative = np.cumsum(weights[valid][order])
+    return values[valid][order][np.searchsorted(cumulative, cumulative[-1] / 2)]
+
+def get_group_uv_scales(groups, areas, uv_areas, texels, target_density):
+    # uv scale of every group that brings its area weighted density to the
+    # target, 1 for groups without a density
+    valid = np.isfinite(get_texel_densities(areas, uv_areas, texels))
+    texel_areas = np.bincount(groups, weights=np.where(valid, uv_areas * texels, 0.0))
+    group_areas = np.bincount(groups, weights=np.where(valid, areas, 0.0))
+    scales = np.ones(len(group_areas))
+    measured = (texel_areas > 0) & (group_areas > 0)
+    scales[measured] = target_density / np.sqrt(texel_areas[measured] / group_areas[measured])
+    return scales
+
+def scale_uv_groups(loop_uv, owners, groups, scales):
+    # loop uvs scaled about the mean uv of the loops of each group, owners
+    # is the face position of each loop and groups the group of each face
+    loop_groups = groups[owners]
+    counts = np.bincount(loop_groups, minlength=len(scales))
+    centers = np.stack([np.bincount(loop_groups, weights=loop_uv[:, axis], minlength=len(scales))
+                        for axis in (0, 1)], axis=1) / np.maximum(counts, 1)[:, None]
+    uvs = (loop_uv - centers[loop_groups]) * scales[loop_groups][:, None] + centers[loop_groups]
+    return uvs.astype(np.float32)
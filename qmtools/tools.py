@@ -0,0 +1,2150 @@
+ 
+# Quick Map Tools - mesh snapshots, caches and tool functions
+# Copyright (C) 2018 John Cruz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# ================================================== 
+# Imports
+# ================================================== 
+
+import bpy
+import bmesh
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import itertools
+import json
+import math
+import mathutils
+import numpy as np
+import os
+import time
+import types
+
+from bpy_extras import view3d_utils
+from mathutils.bvhtree import BVHTree
+
+from .core import (
+    X_AXIS_INDEX,
+    Y_AXIS_INDEX,
+    Z_AXIS_INDEX,
+    ImageFaceIndex,
+    align_coords,
+    build_face_adjacency,
+    cluster_coords,
+    find_coincident_verts,
+    find_near_axis_edges,
+    find_near_grid_coords,
+    get_cube_projection,
+    get_density_histogram,
+    get_face_loops,
+    get_face_uv_areas,
+    get_face_vector_areas,
+    get_grid_multiplier,
+    get_group_uv_scales,
+    get_image_usage,
+    get_reversed_loops,
+    get_submesh,
+    get_texel_densities,
+    get_uv_islands,
+    get_weighted_median,
+    merge_submeshes,
+    scale_cube_projection,
+    scale_uv_groups,
+    select_island_faces,
+    select_linked_faces,
+    snap_coords_to_grid,
+    snap_near_grid_coords,
+    solve_smart_align,
+    transform_coords,
+    transform_normals,
+    transform_vector_areas,
+)
+
+# ================================================== 
+# globals
+# ================================================== 
+
+# number key -> StoredImage
+stored_images = {}
+
+# used when qmtools.tools is imported by a script instead of loaded by the enabled addon
+default_preferences = types.SimpleNamespace(
+    use_edit_mesh=True, image_backend='MATERIAL', snap_duplicates='KEEP', grid_space='WORLD',
+    chunk_threshold=200000, collect_stats=False, stats_log_path='')
+
+# elements read or written per step of a chunked job, time spent on steps
+# per timer tick and the tick interval, in seconds
+chunk_elements = 20000
+chunk_time_budget = 0.05
+chunk_timer_interval = 0.01
+
+# ChunkedJob handed over to the chunked runner operator
+pending_jobs = []
+
+# threads the per object numpy work of a job runs on, made on first use
+compute_pool = None
+
+# report of the steps of an object without a selection
+nothing_selected = 'No faces selected.'
+
+# most recent OperatorStats first, and the one being recorded
+recent_stats = collections.deque(maxlen=50)
+current_stats = None
+stats_panel_rows = 5
+
+# (object name, near axis edges, near grid verts) from the last level audit, worst first
+audit_results = []
+audit_panel_rows = 10
+
+# ImageUsage of every mesh object from the last image usage report, flagged and most draw calls first
+image_usage_results = []
+image_usage_panel_rows = 10
+
+# TexelDensityReport of the last texel density measurement, None before the first
+texel_density_report = None
+texel_density_panel_rows = 10
+
+# mesh pointer -> ActiveElement, dropped when the mesh changes
+active_elements = {}
+
+# mesh pointer -> (slot signature, ImageFaceIndex), dropped when the mesh changes outside qmtools
+image_face_indexes = {}
+
+# image name -> image, rebuilt when a lookup finds it out of date
+image_names = {}
+
+# image pointer -> material showing that image
+image_materials = {}
+
+# mesh pointer -> ids of the caches the next update of that mesh leaves valid
+kept_mesh_caches = {}
+
+# mesh pointer -> (element counts, CSR face adjacency)
+face_adjacency_cache = {}
+
+# mesh pointer -> (face count, object space vector area of every face), dropped when the mesh changes
+face_area_cache = {}
+
+# mesh pointer -> ((face count, UV map name), UV island of every face), dropped when the mesh changes
+uv_island_cache = {}
+
+# mesh pointer -> ((face count, UV map name), UV area of every face), dropped when the mesh changes
+uv_area_cache = {}
+
+# object pointer -> (object name, BVHTree of its evaluated mesh in object space),
+# dropped when the object's geometry changes
+bvh_trees = {}
+
+# ================================================== 
+# Mesh snapshot
+# ==================================================
+
+# (collection path, attribute, dtype, width) for every array a snapshot can hold
+snapshot_layout = {
+    'co': ('vertices', 'co', np.float32, 3),
+    'vert_select': ('vertices', 'select', bool, 1),
+    'edge_verts': ('edges', 'vertices', np.int32, 2),
+    'edge_select': ('edges', 'select', bool, 1),
+    'face_select': ('polygons', 'select', bool, 1),
+    'loop_start': ('polygons', 'loop_start', np.int32, 1),
+    'loop_total': ('polygons', 'loop_total', np.int32, 1),
+    'material_index': ('polygons', 'material_index', np.int32, 1),
+    'face_smooth': ('polygons', 'use_smooth', bool, 1),
+    'face_normal': ('polygons', 'normal', np.float32, 3),
+    'loop_verts': ('loops', 'vertex_index', np.int32, 1),
+    'loop_edges': ('loops', 'edge_index', np.int32, 1),
+    'loop_uv': ('uv_layers.active.data', 'uv', np.float32, 2),
+}
+
+# the same arrays, generated from an edit-mode BMesh
+bmesh_layout = {
+    'co': lambda bm: (c for v in bm.verts for c in v.co),
+    'vert_select': lambda bm: (v.select for v in bm.verts),
+    'edge_verts': lambda bm: (v.index for e in bm.edges for v in e.verts),
+    'edge_select': lambda bm: (e.select for e in bm.edges),
+    'face_select': lambda bm: (f.select for f in bm.faces),
+    'loop_total': lambda bm: (len(f.verts) for f in bm.faces),
+    'material_index': lambda bm: (f.material_index for f in bm.faces),
+    'face_smooth': lambda bm: (f.smooth for f in bm.faces),
+    'face_normal': lambda bm: (c for f in bm.faces for c in f.normal),
+    'loop_verts': lambda bm: (v.index for f in bm.faces for v in f.verts),
+    'loop_edges': lambda bm: (e.index for f in bm.faces for e in f.edges),
+    'loop_uv': lambda bm: (c for f in bm.faces for l in f.loops for c in l[bm.loops.layers.uv.active].uv),
+}
+
+# (BMesh sequence, attribute) of the arrays a write can read element by
+# element, so writing a few faces does not read the whole mesh
+bmesh_elements = {
+    'face_select': ('faces', 'select'),
+    'material_index': ('faces', 'material_index'),
+}
+
+def write_face_select(snapshot, index, value):
+    # select_set() flushes to the verts and edges, which rollback() restores too
+    face = snapshot.bm.faces[index]
+    snapshot.save_selection(itertools.chain((face,), face.verts, face.edges))
+    face.select_set(value)
+
+# how a changed array value is written back to its edit-mode BMesh element
+bmesh_writers = {
+    'co': lambda snapshot, index, value: setattr(snapshot.bm.verts[index], 'co', value),
+    'face_select': write_face_select,
+    'material_index': lambda snapshot, index, value: setattr(snapshot.bm.faces[index], 'material_index', value),
+    'loop_uv': lambda snapshot, index, value: setattr(snapshot.bm_loops[index][snapshot.uv_lay], 'uv', value),
+}
+
+def get_collection(mesh, path):
+    return functools.reduce(getattr, path.split('.'), mesh)
+
+def read_array(collection, attribute, dtype, width=1):
+    array = np.empty(len(collection) * width, dtype=dtype)
+    collection.foreach_get(attribute, array)
+    if width > 1:
+        array.shape = (-1, width)
+    return array
+
+class MeshSnapshot:
+    # Bulk numpy copy of the mesh data used by the operators. Arrays are read
+    # with foreach_get the first time they are needed, and everything that
+    # was changed is written back with foreach_set in a single commit().
+    # Face images come from the material slots unless use_materials is off,
+    # then the per-face images of the active UV map (2.7x only) are used.
+
+    def __init__(self, mesh, use_materials=True):
+        self.mesh = mesh
+        self.use_materials = use_materials or not hasattr(mesh, 'uv_textures')
+        self.arrays = {}
+        self.dirty = set()
+
+    def get(self, key):
+        if key not in self.arrays:
+            collection, attribute, dtype, width = snapshot_layout[key]
+            with stats_phase('extract'):
+                self.arrays[key] = read_array(
+                    get_collection(self.mesh, collection), attribute, dtype, width)
+        return self.arrays[key]
+
+    co = property(lambda self: self.get('co'))
+    vert_select = property(lambda self: self.get('vert_select'))
+    edge_verts = property(lambda self: self.get('edge_verts'))
+    edge_select = property(lambda self: self.get('edge_select'))
+    face_select = property(lambda self: self.get('face_select'))
+    loop_start = property(lambda self: self.get('loop_start'))
+    loop_total = property(lambda self: self.get('loop_total'))
+    loop_verts = property(lambda self: self.get('loop_verts'))
+    loop_edges = property(lambda self: self.get('loop_edges'))
+    material_index = property(lambda self: self.get('material_index'))
+    face_smooth = property(lambda self: self.get('face_smooth'))
+    loop_uv = property(lambda self: self.get('loop_uv'))
+
+    @property
+    def active_face(self):
+        return self.mesh.polygons.active
+
+    @property
+    def uv_map_name(self):
+        return getattr(self.mesh.uv_layers.active, 'name', None)
+
+    def element_counts(self):
+        # (faces, edges, verts) without reading any array
+        mesh = self.mesh
+        return len(mesh.polygons), len(mesh.edges), len(mesh.vertices)
+
+    def select_everything(self):
+        # work on the whole mesh without touching the stored selection
+        for key in ('vert_select', 'edge_select', 'face_select'):
+            collection = get_collection(self.mesh, snapshot_layout[key][0])
+            self.arrays[key] = np.ones(len(collection), dtype=bool)
+
+    def selected_verts(self):
+        return np.flatnonzero(self.vert_select)
+
+    def selected_edges(self):
+        return self.edge_verts[self.edge_select]
+
+    def selected_faces(self):
+        return np.flatnonzero(self.face_select)
+
+    def face_normal(self, face_index):
+        return self.mesh.polygons[face_index].normal.copy()
+
+    def face_material(self, face_index):
+        return self.mesh.polygons[face_index].material_index
+
+    def face_image(self, face_index):
+        if not self.use_materials:
+            return self.face_tex_image(face_index)
+        slot_images = get_slot_images(self.mesh)
+        return slot_images[min(self.face_material(face_index), len(slot_images) - 1)]
+
+    def slot_image_names(self):
+        # image name of every material slot, None when faces hold their own image
+        if not self.use_materials:
+            return None
+        return tuple(get_image_key(image) for image in get_slot_images(self.mesh))
+
+    def image_slots(self):
+        # (image names, index into them for every face)
+        names = self.slot_image_names()
+        if names is not None:
+            return names, np.minimum(self.material_index, len(names) - 1)
+
+        slots = collections.OrderedDict()
+        images = self.face_tex_images()
+        face_slots = np.fromiter(
+            (slots.setdefault(get_image_key(image), len(slots)) for image in images), np.int32, len(images))
+        return list(slots) or [None], face_slots
+
+    def set_face_images(self, indices, image):
+        if self.use_materials:
+            self.set_values('material_index', indices, get_image_material_slot(self.mesh, image))
+        else:
+            self.set_face_tex_images(np.asarray(indices).tolist(), image)
+
+    def face_tex_image(self, face_index):
+        return self.mesh.uv_textures.active.data[face_index].image
+
+    def face_tex_images(self):
+        with stats_phase('extract'):
+            return [data.image for data in self.mesh.uv_textures.active.data]
+
+    def set_face_tex_images(self, indices, image):
+        tex_data = self.mesh.uv_textures.active.data
+        with stats_phase('write'):
+            for face_index in indices:
+                tex_data[face_index].image = image
+
+    def set_coords(self, indices, coords):
+        self.set_values('co', indices, coords)
+
+    def set_values(self, key, indices, value):
+        self.get(key)[indices] = value
+        self.dirty.add(key)
+
+    def select_faces(self, indices):
+        self.set_values('face_select', indices, True)
+
+    def select_only_verts(self, indices):
+        # the edges and faces of those vertices follow, like a vertex mode flush
+        vert_select = np.zeros(len(self.co), dtype=bool)
+        vert_select[indices] = True
+        selection = {
+            'vert_select': vert_select,
+            'edge_select': vert_select[self.edge_verts].all(axis=1),
+            'face_select': np.logical_and.reduceat(vert_select[self.loop_verts], self.loop_start)
+                           if len(self.loop_start) else np.zeros(0, dtype=bool),
+        }
+        self.arrays.update(selection)
+        self.dirty.update(selection)
+
+    def weld_verts(self, duplicates, targets):
+        # merges every duplicate into its target, call after commit()
+        with stats_phase('write'):
+            bm = bmesh.new()
+            bm.from_mesh(self.mesh)
+            weld_bmesh_verts(bm, duplicates, targets)
+            bm.to_mesh(self.mesh)
+            bm.free()
+            drop_mesh_caches(self.mesh)
+            self.mesh.update()
+        self.arrays.clear()
+
+    def read_steps(self, keys):
+        # reads the arrays ahead for a ChunkedJob, yields (phase, fraction done)
+        for done, key in enumerate(keys, 1):
+            self.get(key)
+            yield 'reading', done / len(keys)
+
+    def commit_steps(self, keep=()):
+        # foreach_set writes everything at once
+        self.commit(keep)
+        yield 'writing', 1.0
+
+    def rollback(self):
+        pass  # nothing reaches the mesh before commit()
+
+    def commit(self, keep=()):
+        # keep lists the mesh caches this write leaves valid
+        if not self.dirty:
+            return
+        with stats_phase('write'):
+            for key in self.dirty:
+                collection, attribute = snapshot_layout[key][:2]
+                get_collection(self.mesh, collection).foreach_set(attribute, self.arrays[key].ravel())
+            self.dirty.clear()
+            keep_mesh_caches(self.mesh, *keep)
+            self.mesh.update()
+
+class EditMeshSnapshot(MeshSnapshot):
+    # Same interface, backed by the live edit-mode BMesh so no mode switch is
+    # needed. Only the elements that were written are touched on commit().
+
+    def __init__(self, mesh, use_materials=True):
+        super().__init__(mesh, use_materials)
+        with stats_phase('extract'):
+            self.bm = bmesh.from_edit_mesh(mesh)
+            for seq in (self.bm.verts, self.bm.edges, self.bm.faces):
+                seq.index_update()
+                seq.ensure_lookup_table()
+        self.written = {}
+        self.originals = {}
+        self.committed = []
+        # BMesh element -> its select flag before the first selection write
+        self.selection = {}
+        self.loops = None
+        # key -> which elements of a partly read array are known
+        self.partial = {}
+
+    def get(self, key):
+        if key in self.partial:
+            # read in full, the values written so far and their originals stay
+            known = self.partial.pop(key)
+            values, originals = self.arrays.pop(key), self.originals[key]
+            array = self.get(key)
+            self.originals[key] = np.where(known, originals, array)
+            array[known] = values[known]
+            return array
+
+        if key not in self.arrays:
+            if key == 'loop_start':
+                total = self.loop_total
+                self.arrays[key] = (np.cumsum(total) - total).astype(np.int32)
+                return self.arrays[key]
+
+            dtype, width = snapshot_layout[key][2:]
+            with stats_phase('extract'):
+                array = np.fromiter(bmesh_layout[key](self.bm), dtype)
+            if width > 1:
+                array.shape = (-1, width)
+            self.arrays[key] = array
+        return self.arrays[key]
+
+    @property
+    def tex_lay(self):
+        return self.bm.faces.layers.tex.active
+
+    @property
+    def uv_lay(self):
+        return self.bm.loops.layers.uv.active
+
+    @property
+    def uv_map_name(self):
+        return getattr(self.uv_lay, 'name', None)
+
+    def element_counts(self):
+        bm = self.bm
+        return len(bm.faces), len(bm.edges), len(bm.verts)
+
+    @property
+    def bm_loops(self):
+        # BMesh has no loop lookup table, index them in face order once
+        if self.loops is None:
+            self.loops = [loop for face in self.bm.faces for loop in face.loops]
+        return self.loops
+
+    @property
+    def active_face(self):
+        face = self.bm.faces.active
+        return face.index if face else None
+
+    def face_normal(self, face_index):
+        return self.bm.faces[face_index].normal.copy()
+
+    def face_material(self, face_index):
+        return self.bm.faces[face_index].material_index
+
+    def face_tex_image(self, face_index):
+        return self.bm.faces[face_index][self.tex_lay].image
+
+    def face_tex_images(self):
+        tex_lay = self.tex_lay
+        with stats_phase('extract'):
+            return [face[tex_lay].image for face in self.bm.faces]
+
+    def set_face_tex_images(self, indices, image):
+        faces = self.bm.faces
+        tex_lay = self.tex_lay
+        with stats_phase('write'):
+            for face_index in indices:
+                faces[face_index][tex_lay].image = image
+        self.dirty.add('image')
+
+    def set_values(self, key, indices, value):
+        if key in bmesh_elements and (key not in self.arrays or key in self.partial):
+            self.read_elements(key, np.atleast_1d(indices))
+        elif key not in self.originals:
+            self.originals[key] = self.get(key).copy()
+        # not through get(), which would read a partly known array in full
+        self.arrays[key][indices] = value
+        self.dirty.add(key)
+        self.written.setdefault(key, []).append(np.atleast_1d(indices))
+
+    def read_elements(self, key, indices):
+        # reads only the elements at indices into a partly known array
+        sequence_name, attribute = bmesh_elements[key]
+        sequence = getattr(self.bm, sequence_name)
+        if key not in self.arrays:
+            dtype = snapshot_layout[key][2]
+            self.arrays[key] = np.zeros(len(sequence), dtype)
+            self.originals[key] = np.zeros(len(sequence), dtype)
+            self.partial[key] = np.zeros(len(sequence), dtype=bool)
+
+        known = self.partial[key]
+        indices = indices[~known[indices]]
+        with stats_phase('extract'):
+            values = np.fromiter((getattr(sequence[index], attribute) for index in indices.tolist()),
+                                 self.arrays[key].dtype, len(indices))
+        self.arrays[key][indices] = values
+        self.originals[key][indices] = values
+        known[indices] = True
+
+    def select_only_verts(self, indices):
+        bm = self.bm
+        previous = [(elements, np.flatnonzero(self.get(key)).tolist()) for elements, key in
+                    ((bm.verts, 'vert_select'), (bm.edges, 'edge_select'), (bm.faces, 'face_select'))]
+        super().select_only_verts(indices)
+
+        with stats_phase('write'):
+            self.save_selection(elements[index] for elements, selected in previous for index in selected)
+            verts = [bm.verts[index] for index in np.asarray(indices).tolist()]
+            self.save_selection(itertools.chain(verts, *(itertools.chain(vert.link_edges, vert.link_faces)
+                                                         for vert in verts)))
+            for elements, selected in previous:
+                for index in selected:
+                    elements[index].select = False
+            for index in np.asarray(indices).tolist():
+                bm.verts[index].select = True
+            bm.select_flush(True)
+
+    def weld_verts(self, duplicates, targets):
+        with stats_phase('write'):
+            weld_bmesh_verts(self.bm, duplicates, targets)
+            for seq in (self.bm.verts, self.bm.edges, self.bm.faces):
+                seq.index_update()
+                seq.ensure_lookup_table()
+            drop_mesh_caches(self.mesh)
+            bmesh.update_edit_mesh(self.mesh)
+        self.arrays.clear()
+        self.partial.clear()
+        self.selection.clear()
+        self.loops = None
+
+    def read_steps(self, keys):
+        # the BMesh is read chunk_elements at a time
+        for done, key in enumerate(keys):
+            if key in self.arrays or key == 'loop_start':
+                self.get(key)
+                continue
+
+            dtype, width = snapshot_layout[key][2:]
+            values = bmesh_layout[key](self.bm)
+            chunks = []
+            while not chunks or len(chunks[-1]) == chunk_elements * width:
+                with stats_phase('extract'):
+                    chunks.append(np.fromiter(itertools.islice(values, chunk_elements * width), dtype))
+                yield 'reading', done / len(keys)
+
+            array = np.concatenate(chunks)
+            if width > 1:
+                array.shape = (-1, width)
+            self.arrays[key] = array
+        yield 'reading', 1.0
+
+    def commit_steps(self, keep=()):
+        # written chunk_elements at a time, rollback() undoes the written chunks
+        if not self.dirty:
+            return
+        writes = [(key, np.unique(np.concatenate(written))) for key, written in self.written.items()]
+        total = sum(len(indices) for key, indices in writes)
+        done = 0
+
+        for key, indices in writes:
+            write = bmesh_writers[key]
+            for start in range(0, len(indices), chunk_elements):
+                chunk = indices[start:start + chunk_elements]
+                with stats_phase('write'):
+                    for index, value in zip(chunk.tolist(), self.arrays[key][chunk].tolist()):
+                        write(self, index, value)
+                self.committed.append((key, chunk))
+                done += len(chunk)
+                yield 'writing', done / total
+
+        with stats_phase('write'):
+            keep_mesh_caches(self.mesh, *keep)
+            update_edit_mesh(self.mesh, geometry='co' in self.dirty)
+        self.written.clear()
+        self.dirty.clear()
+        self.committed = []
+        self.selection.clear()
+
+    def save_selection(self, elements):
+        for element in elements:
+            self.selection.setdefault(element, element.select)
+
+    def rollback(self):
+        # Selection is put back flag by flag: writing the face_select originals
+        # with select_set() would also deselect verts and edges that belong to
+        # faces that were selected before.
+        for key, chunk in self.committed:
+            if key == 'face_select':
+                continue
+            write = bmesh_writers[key]
+            for index, value in zip(chunk.tolist(), self.originals[key][chunk].tolist()):
+                write(self, index, value)
+
+        if self.selection:
+            # setting a flag flushes down, so deselect top down, then select bottom up
+            kinds = (bmesh.types.BMFace, bmesh.types.BMEdge, bmesh.types.BMVert)
+            for kind in kinds:
+                for element, select in self.selection.items():
+                    if not select and isinstance(element, kind):
+                        element.select = False
+            for kind in reversed(kinds):
+                for element, select in self.selection.items():
+                    if select and isinstance(element, kind):
+                        element.select = True
+            self.bm.select_flush_mode()
+
+        if self.committed or self.selection:
+            update_edit_mesh(self.mesh, geometry=True)
+        self.committed = []
+        self.selection.clear()
+
+    def commit(self, keep=()):
+        for step in self.commit_steps(keep):
+            pass
+
+def weld_bmesh_verts(bm, duplicates, targets):
+    verts = bm.verts
+    verts.ensure_lookup_table()
+    targetmap = {verts[duplicate]: verts[target] for duplicate, target in zip(duplicates.tolist(), targets.tolist())}
+    bmesh.ops.weld_verts(bm, targetmap=targetmap)
+
+def update_edit_mesh(mesh, geometry):
+    # only retessellate when coordinates moved, never rebuild topology
+    try:
+        bmesh.update_edit_mesh(mesh, loop_triangles=geometry, destructive=False)
+    except TypeError:
+        bmesh.update_edit_mesh(mesh, tessface=geometry, destructive=False)
+
+@contextlib.contextmanager
+def object_mode(context):
+    mode = context.active_object.mode
+    with stats_phase('mode switch'):
+        bpy.ops.object.mode_set(mode='OBJECT')
+    try:
+        yield context.active_object.data
+    finally:
+        with stats_phase('mode switch'):
+            bpy.ops.object.mode_set(mode=mode)
+
+@contextlib.contextmanager
+def mesh_snapshot(context):
+    obj = context.active_object
+    preferences = get_preferences(context)
+    use_materials = preferences.image_backend == 'MATERIAL'
+    if obj.mode == 'EDIT' and preferences.use_edit_mesh:
+        yield EditMeshSnapshot(obj.data, use_materials)
+    else:
+        with object_mode(context) as mesh:
+            yield MeshSnapshot(mesh, use_materials)
+
+@contextlib.contextmanager
+def mesh_snapshots(context):
+    # (object, snapshot) for every mesh get_mesh_objects() finds
+    objects = get_mesh_objects(context)
+    preferences = get_preferences(context)
+    use_materials = preferences.image_backend == 'MATERIAL'
+    if context.active_object.mode == 'EDIT' and preferences.use_edit_mesh:
+        yield [(obj, EditMeshSnapshot(obj.data, use_materials)) for obj in objects]
+    else:
+        with object_mode(context):
+            yield [(obj, MeshSnapshot(obj.data, use_materials)) for obj in objects]
+
+def get_mesh_objects(context):
+    # the objects in edit mode, or the selected ones in object mode, one per mesh
+    obj = context.active_object
+    if obj.mode == 'EDIT':
+        objects = getattr(context, 'objects_in_mode', None) or [obj]
+    else:
+        objects = context.selected_objects
+
+    meshes = set()
+    mesh_objects = []
+    for obj in objects:
+        if obj.type == 'MESH' and obj.data not in meshes:
+            meshes.add(obj.data)
+            mesh_objects.append(obj)
+    return mesh_objects
+
+def get_preferences(context):
+    preferences = getattr(context, 'preferences', None) or context.user_preferences
+    addon = preferences.addons.get(__package__)
+    return addon.preferences if addon else default_preferences
+
+# ================================================== 
+# Face adjacency
+# ==================================================
+
+def get_face_adjacency(snapshot):
+    # cached per mesh until a geometry update, a change in element counts is
+    # taken as a topology change too
+    def build(snapshot):
+        loop_total, loop_edges = snapshot.loop_total, snapshot.loop_edges
+        with stats_phase('compute'):
+            return build_face_adjacency(loop_total, loop_edges)
+
+    return get_cached(face_adjacency_cache, snapshot, snapshot.element_counts(), build, 'face adjacency')
+
+# ================================================== 
+# Face areas
+# ==================================================
+
+def get_face_vector_areas_cached(snapshot):
+    # cached per mesh, in object space so instances with other transforms share it
+    def build(snapshot):
+        co, loop_start, loop_total, loop_verts = (
+            snapshot.co, snapshot.loop_start, snapshot.loop_total, snapshot.loop_verts)
+        with stats_phase('compute'):
+            return get_face_vector_areas(co, loop_start, loop_total, loop_verts)
+
+    return get_cached(face_area_cache, snapshot, snapshot.element_counts(), build, 'face areas')
+
+# ================================================== 
+# UV islands
+# ==================================================
+
+def get_uv_islands_cached(snapshot):
+    # cached per mesh, None when the mesh has no UV map
+    uv_map_name = snapshot.uv_map_name
+    if uv_map_name == None:
+        return None
+
+    def build(snapshot):
+        loop_start, loop_total, loop_verts, loop_uv = (
+            snapshot.loop_start, snapshot.loop_total, snapshot.loop_verts, snapshot.loop_uv)
+        with stats_phase('compute'):
+            return get_uv_islands(loop_start, loop_total, loop_verts, loop_uv)
+
+    return get_cached(uv_island_cache, snapshot, snapshot.element_counts() + (uv_map_name,), build, 'uv islands')
+
+def get_face_uv_areas_cached(snapshot):
+    # cached per mesh, None when the mesh has no UV map
+    uv_map_name = snapshot.uv_map_name
+    if uv_map_name == None:
+        return None
+
+    def build(snapshot):
+        loop_start, loop_total, loop_uv = snapshot.loop_start, snapshot.loop_total, snapshot.loop_uv
+        with stats_phase('compute'):
+            return get_face_uv_areas(loop_start, loop_total, loop_uv)
+
+    return get_cached(uv_area_cache, snapshot, snapshot.element_counts() + (uv_map_name,), build, 'uv areas')
+
+# ================================================== 
+# Image index
+# ==================================================
+
+def get_image_key(image):
+    return image.name if image != None else None
+
+def get_image_index_signature(snapshot):
+    # new slot images count as a change of the mesh, like a new face count
+    return (snapshot.element_counts()[0], snapshot.slot_image_names())
+
+def get_image_face_index(snapshot):
+    def build(snapshot):
+        slot_names, face_slots = snapshot.image_slots()
+        with stats_phase('compute'):
+            return ImageFaceIndex(slot_names, face_slots)
+
+    return get_cached(image_face_indexes, snapshot, get_image_index_signature(snapshot), build, 'image index')
+
+def find_image(name):
+    image = image_names.get(name)
+    try:
+        if image != None and image.name == name:
+            return image
+    except ReferenceError:
+        pass
+
+    # added, removed or renamed since the last lookup
+    image_names.clear()
+    image_names.update((image.name, image) for image in bpy.data.images)
+    return image_names.get(name)
+
+class StoredImage:
+    # Image kept in a number slot. The reference follows renames, the name
+    # finds the image again when undo or a reload frees the reference.
+
+    def __init__(self, image):
+        self.image = image
+        self.name = image.name
+
+def get_stored_image(key):
+    stored = stored_images.get(key)
+    if stored is None:
+        return None
+    try:
+        stored.name = stored.image.name
+    except (ReferenceError, AttributeError):
+        stored.image = find_image(stored.name)
+    return stored.image
+
+# ================================================== 
+# Image materials
+# ==================================================
+
+def get_slot_images(mesh):
+    return [get_material_image(material) for material in mesh.materials] or [None]
+
+def get_material_image(material):
+    # first image texture, Blender Internal texture slots or shader nodes
+    if material == None:
+        return None
+    for slot in getattr(material, 'texture_slots', ()):
+        if slot and slot.texture and slot.texture.type == 'IMAGE':
+            return slot.texture.image
+    if material.use_nodes and material.node_tree:
+        for node in material.node_tree.nodes:
+            if node.type == 'TEX_IMAGE':
+                return node.image
+    return None
+
+def get_image_material(image):
+    pointer = image.as_pointer()
+    material = image_materials.get(pointer)
+    try:
+        if material != None and get_material_image(material) == image:
+            return material
+    except ReferenceError:
+        pass
+
+    for material in bpy.data.materials:
+        if get_material_image(material) == image:
+            break
+    else:
+        material = create_image_material(image)
+    image_materials[pointer] = material
+    return material
+
+def create_image_material(image):
+    material = bpy.data.materials.new(image.name)
+    if hasattr(material, 'texture_slots'):
+        texture = bpy.data.textures.new(image.name, 'IMAGE')
+        texture.image = image
+        slot = material.texture_slots.add()
+        slot.texture = texture
+        slot.texture_coords = 'UV'
+    else:
+        material.use_nodes = True
+        tree = material.node_tree
+        node = tree.nodes.new('ShaderNodeTexImage')
+        node.image = image
+        shader = tree.nodes.get('Principled BSDF')
+        if shader:
+            tree.links.new(node.outputs['Color'], shader.inputs['Base Color'])
+    return material
+
+def get_image_material_slot(mesh, image):
+    material = get_image_material(image)
+    for slot, slot_material in enumerate(mesh.materials):
+        if slot_material == material:
+            return slot
+    if not mesh.materials:
+        # every face is on slot 0 already, keep that one empty for the faces
+        # that do not get the image
+        mesh.materials.append(None)
+    mesh.materials.append(material)
+    return len(mesh.materials) - 1
+
+# ================================================== 
+# Active element
+# ==================================================
+
+ActiveElement = collections.namedtuple('ActiveElement', 'kind index position key')
+
+def get_active_element(mesh):
+    # Constant time lookup of the active vertex, edge or face and its snap
+    # position. Edit mode reads select_history straight from the edit BMesh,
+    # object mode falls back to the cached history or polygons.active.
+    pointer = mesh.as_pointer()
+    cached = active_elements.get(pointer)
+
+    if mesh.is_editmode:
+        elem = bmesh.from_edit_mesh(mesh).select_history.active
+        if elem is None:
+            active_elements.pop(pointer, None)
+            return None
+        count_cache('active element', cached is not None and cached.key == hash(elem))
+        if cached is not None and cached.key == hash(elem):
+            return cached
+        active = ActiveElement(get_element_kind(elem), elem.index, get_element_position(elem), hash(elem))
+    else:
+        count_cache('active element', cached is not None)
+        if cached is not None:
+            return cached
+        face_index = mesh.polygons.active
+        if not 0 <= face_index < len(mesh.polygons):
+            return None
+        verts = mesh.polygons[face_index].vertices
+        position = sum((mesh.vertices[i].co for i in verts), mathutils.Vector()) / len(verts)
+        active = ActiveElement('FACE', face_index, position, None)
+
+    active_elements[pointer] = active
+    return active
+
+def get_element_kind(elem):
+    if isinstance(elem, bmesh.types.BMVert):
+        return 'VERT'
+    if isinstance(elem, bmesh.types.BMEdge):
+        return 'EDGE'
+    return 'FACE'
+
+def get_element_position(elem):
+    if isinstance(elem, bmesh.types.BMVert):
+        return elem.co.copy()
+    if isinstance(elem, bmesh.types.BMEdge):
+        return elem.verts[0].co.lerp(elem.verts[1].co, 0.5)
+    return elem.calc_center_median()
+
+# ================================================== 
+# Mesh caches
+# ==================================================
+
+def get_cached(cache, snapshot, signature, build, name):
+    # The per mesh caches map the mesh pointer to (signature, value). The
+    # value is built again with build(snapshot) when the signature no longer
+    # matches, name is what the hits and misses are counted as.
+    pointer = snapshot.mesh.as_pointer()
+    cached = cache.get(pointer)
+    hit = cached is not None and cached[0] == signature
+    count_cache(name, hit)
+    if hit:
+        return cached[1]
+
+    value = build(snapshot)
+    cache[pointer] = (signature, value)
+    return value
+
+def is_cache_current(cache, snapshot, signature):
+    cached = cache.get(snapshot.mesh.as_pointer())
+    return cached is not None and cached[0] == signature
+
+def keep_mesh_caches(mesh, *caches):
+    # the next update of this mesh is a write made by qmtools that leaves
+    # these caches valid (or already brought them up to date). Snapshot
+    # writes never change the topology, welds drop the caches themselves.
+    kept_mesh_caches[mesh.as_pointer()] = {id(cache) for cache in (face_adjacency_cache,) + caches}
+
+@bpy.app.handlers.persistent
+def invalidate_mesh_caches(scene, depsgraph=None):
+    if not (active_elements or image_face_indexes or face_adjacency_cache or face_area_cache or uv_island_cache or
+            uv_area_cache or bvh_trees):
+        return
+
+    if depsgraph is not None:
+        updated = {update.id.original for update in depsgraph.updates if update.is_updated_geometry}
+        meshes = {getattr(datablock, 'data', datablock) for datablock in updated}
+    elif bpy.data.objects.is_updated:
+        updated = {obj for obj in bpy.data.objects if obj.is_updated_data}
+        meshes = {obj.data for obj in updated}
+    else:
+        return
+
+    for datablock in updated:
+        bvh_trees.pop(datablock.as_pointer(), None)
+
+    for mesh in meshes:
+        if not isinstance(mesh, bpy.types.Mesh):
+            continue
+        pointer = mesh.as_pointer()
+        kept = kept_mesh_caches.pop(pointer, ())
+        for cache in (active_elements, image_face_indexes, face_adjacency_cache, face_area_cache, uv_island_cache,
+                      uv_area_cache):
+            if id(cache) not in kept:
+                cache.pop(pointer, None)
+
+def drop_mesh_caches(mesh):
+    # for writes that change the topology
+    pointer = mesh.as_pointer()
+    for cache in (active_elements, image_face_indexes, face_adjacency_cache, face_area_cache, uv_island_cache,
+                  uv_area_cache, kept_mesh_caches):
+        cache.pop(pointer, None)
+
+@bpy.app.handlers.persistent
+def clear_mesh_caches(*args):
+    for cache in (active_elements, image_face_indexes, face_adjacency_cache, face_area_cache, uv_island_cache,
+                  uv_area_cache, kept_mesh_caches, image_names, image_materials, bvh_trees):
+        cache.clear()
+
+def get_update_handlers():
+    handlers = bpy.app.handlers
+    return getattr(handlers, 'depsgraph_update_post', None) or handlers.scene_update_post
+
+def get_reset_handlers():
+    handlers = bpy.app.handlers
+    return (handlers.undo_post, handlers.redo_post, handlers.load_post)
+
+def add_handlers():
+    get_update_handlers().append(invalidate_mesh_caches)
+    for handlers in get_reset_handlers():
+        handlers.append(clear_mesh_caches)
+
+def remove_handlers():
+    for handlers, handler in [(get_update_handlers(), invalidate_mesh_caches)] + \
+            [(handlers, clear_mesh_caches) for handlers in get_reset_handlers()]:
+        if handler in handlers:
+            handlers.remove(handler)
+    clear_mesh_caches()
+
+# ================================================== 
+# Stats
+# ==================================================
+
+class OperatorStats:
+    # Timings and counters for one run of an instrumented function. Time is
+    # charged to the innermost open phase only, so nested phases don't count
+    # twice. Deferred stats belong to a chunked job that outlives the call,
+    # the job records them when it ends.
+
+    def __init__(self, name):
+        self.name = name
+        self.deferred = False
+        self.time = time.time()
+        self.total = 0.0
+        self.phases = collections.OrderedDict()
+        self.counts = collections.OrderedDict()
+        self.phase_stack = []
+        self.mark = time.perf_counter()
+
+    def begin_phase(self, name):
+        self.charge()
+        self.phase_stack.append(name)
+
+    def end_phase(self):
+        self.charge()
+        self.phase_stack.pop()
+
+    def charge(self):
+        now = time.perf_counter()
+        if self.phase_stack:
+            name = self.phase_stack[-1]
+            self.phases[name] = self.phases.get(name, 0.0) + now - self.mark
+        self.mark = now
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'time': self.time,
+            'total': self.total,
+            'phases': dict(self.phases),
+            'counts': dict(self.counts),
+        }
+
+def instrumented(func):
+    # records an OperatorStats for every top level call when stats are on
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        global current_stats
+        if current_stats is not None or not get_preferences(bpy.context).collect_stats:
+            return func(*args, **kwargs)
+
+        stats = current_stats = OperatorStats(func.__name__)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stats.total += time.perf_counter() - start
+            current_stats = None
+            if not stats.deferred:
+                record_stats(stats)
+    return wrapper
+
+@contextlib.contextmanager
+def resumed_stats(stats):
+    # makes the stats of an earlier instrumented call current again, for the
+    # chunked job steps that run from the modal timer
+    global current_stats
+    if stats is None or current_stats is not None:
+        yield
+        return
+
+    current_stats = stats
+    stats.mark = time.perf_counter()
+    start = stats.mark
+    try:
+        yield
+    finally:
+        stats.charge()
+        stats.total += time.perf_counter() - start
+        current_stats = None
+
+@contextlib.contextmanager
+def stats_phase(name):
+    stats = current_stats
+    if stats is None:
+        yield
+        return
+
+    stats.begin_phase(name)
+    try:
+        yield
+    finally:
+        stats.end_phase()
+
+def count_stat(name, amount=1):
+    if current_stats is not None:
+        current_stats.counts[name] = current_stats.counts.get(name, 0) + amount
+
+def count_cache(name, hit):
+    count_stat(name + (' hits' if hit else ' misses'))
+
+def record_stats(stats):
+    recent_stats.appendleft(stats)
+
+    path = get_preferences(bpy.context).stats_log_path
+    if path:
+        write_stats(bpy.path.abspath(path), [stats], mode='a')
+
+def write_stats(path, stats_list, mode='w'):
+    with open(path, mode) as stats_file:
+        for stats in stats_list:
+            stats_file.write(json.dumps(stats.as_dict(), sort_keys=True) + '\n')
+
+# ================================================== 
+# Chunked jobs
+# ==================================================
+
+class ChunkedJob:
+    # An operation on the meshes get_mesh_objects() finds, split into steps.
+    # make_steps(parts) gets the (object, snapshot) parts and returns a steps
+    # generator that yields (phase, fraction done) and may return a (level,
+    # message) report, usually object_steps(). run() does as many steps as
+    # fit in a time budget so the chunked runner can show progress between
+    # timer ticks, cancel() rolls back whatever was already written. The
+    # snapshots stay open until the job ends. The job keeps the stats of the
+    # instrumented call that created it and counts its steps there too.
+
+    def __init__(self, label, context, make_steps):
+        self.label = label
+        self.stats = current_stats
+        self.phase = ''
+        self.progress = 0.0
+        self.message = None
+        with contextlib.ExitStack() as stack:
+            self.parts = stack.enter_context(mesh_snapshots(context))
+            self.steps = make_steps(self.parts)
+            self.stack = stack.pop_all()
+
+    def run(self, budget=None):
+        # True once every step ran
+        end = time.perf_counter() + budget if budget is not None else None
+        try:
+            with resumed_stats(self.stats):
+                while end is None or time.perf_counter() < end:
+                    self.phase, self.progress = next(self.steps)
+        except StopIteration as stop:
+            self.message = stop.value
+            self.stack.close()
+            self.record_stats()
+            return True
+        except Exception:
+            self.cancel()
+            raise
+        return False
+
+    def cancel(self):
+        try:
+            with resumed_stats(self.stats):
+                count_stat('cancelled')
+                self.steps.close()
+                for obj, snapshot in self.parts:
+                    snapshot.rollback()
+        finally:
+            self.stack.close()
+            self.record_stats()
+
+    def defer_stats(self):
+        # the job runs on after the instrumented call returns
+        if self.stats is not None:
+            self.stats.deferred = True
+
+    def record_stats(self):
+        if self.stats is not None and self.stats.deferred:
+            self.stats.deferred = False
+            record_stats(self.stats)
+
+    def report(self, operator):
+        if self.message:
+            operator.report(*self.message)
+
+def run_chunked(operator, context, label, mesh_size, make_steps):
+    # mesh_size(mesh) summed over the objects is the job size. Jobs up to the
+    # chunk threshold run right away, bigger ones in the chunked runner modal.
+    size = sum(mesh_size(obj.data) for obj in get_mesh_objects(context))
+    job = ChunkedJob(label, context, make_steps)
+    if size <= get_preferences(context).chunk_threshold:
+        job.run()
+        job.report(operator)
+    else:
+        job.defer_stats()
+        pending_jobs.append(job)
+        bpy.ops.wm.qmtools_run_chunked('INVOKE_DEFAULT')
+
+ComputeRequest = collections.namedtuple('ComputeRequest', 'func args')
+
+def object_steps(parts, make_steps):
+    # Runs the make_steps(obj, snapshot) steps of every part side by side.
+    # Besides (phase, fraction done) they may yield a ComputeRequest and get
+    # its result sent back. Once every object waits on one or is done, the
+    # requests of all objects go to compute_all() together, so bpy is only
+    # ever touched from here while the numpy work runs in parallel.
+    steps = [make_steps(obj, snapshot) for obj, snapshot in parts]
+    progress = [0.0] * len(steps)
+    reports = [None] * len(steps)
+    results = {}
+    waiting = list(range(len(steps)))
+    try:
+        while waiting:
+            requests = {}
+            for i in waiting:
+                try:
+                    value = steps[i].send(results.get(i))
+                    while not isinstance(value, ComputeRequest):
+                        phase, progress[i] = value
+                        yield phase, sum(progress) / len(progress)
+                        value = next(steps[i])
+                    requests[i] = value
+                except StopIteration as stop:
+                    progress[i] = 1.0
+                    reports[i] = stop.value
+
+            waiting = sorted(requests)
+            if waiting:
+                with stats_phase('compute'):
+                    results = dict(zip(waiting, compute_all([requests[i] for i in waiting])))
+    finally:
+        for step in steps:
+            step.close()
+    return combine_reports(parts, reports)
+
+def compute_all(requests):
+    # func(*args) of every request. numpy lets go of the GIL in its kernels,
+    # so the requests run side by side on the compute pool. They may only
+    # touch the arrays they are given, never bpy.
+    if len(requests) < 2:
+        return [func(*args) for func, args in requests]
+
+    global compute_pool
+    if compute_pool is None:
+        compute_pool = concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+    count_stat('parallel requests', len(requests))
+    futures = [compute_pool.submit(func, *args) for func, args in requests]
+    return [future.result() for future in futures]
+
+def shutdown_compute_pool():
+    global compute_pool
+    if compute_pool is not None:
+        compute_pool.shutdown()
+        compute_pool = None
+
+def combine_reports(parts, reports):
+    # One (level, message) for the whole job, with the object names in front
+    # when several objects had something to say. Objects with nothing
+    # selected are left out, unless that goes for all of them.
+    named = [(obj.name, report) for (obj, snapshot), report in zip(parts, reports) if report]
+    if not named:
+        return None
+    if len(named) == len(parts) and len(set(message for name, (level, message) in named)) == 1:
+        return named[0][1]
+
+    named = [(name, report) for name, report in named if report[1] != nothing_selected]
+    if not named:
+        return None
+    if len(parts) == 1:
+        return named[0][1]
+
+    levels = set().union(*(level for name, (level, message) in named))
+    severity = next((severity for severity in ('ERROR', 'WARNING') if severity in levels), 'INFO')
+    return {severity}, "; ".join("{}: {}".format(name, message) for name, (level, message) in named)
+
+# ================================================== 
+# Functions
+# ==================================================
+
+@instrumented
+def align_to_grid_on_axes(operator, context, axes, on_minor, grid_scale=None, grid_subdivisions=None,
+                          grid_space=None):
+    # grid settings default to the ones of the 3D view, the grid space to the preferences
+    if grid_scale is None or grid_subdivisions is None:
+        grid_scale, grid_subdivisions = get_view_grid(context)
+    multiplier = get_grid_multiplier(grid_scale, grid_subdivisions, on_minor)
+
+    preferences = get_preferences(context)
+    scene, grid_space = context.scene, grid_space or preferences.grid_space
+    duplicates_mode = preferences.snap_duplicates
+
+    def make_steps(obj, snapshot):
+        matrix = get_grid_matrix(scene, obj, grid_space)
+        return grid_snap_steps(snapshot, axes, multiplier, duplicates_mode, matrix)
+
+    run_chunked(operator, context, "Grid Snap", lambda mesh: mesh.total_vert_sel,
+                lambda parts: object_steps(parts, make_steps))
+
+def grid_snap_steps(snapshot, axes, multiplier, duplicates_mode='KEEP', matrix=None):
+    # matrix is the grid matrix of the object, see get_grid_matrix()
+    if matrix is not None and matrix.determinant() == 0:
+        return {'ERROR'}, "Zero scale on an axis"
+
+    yield from snapshot.read_steps(('vert_select', 'co'))
+    verts = snapshot.selected_verts()
+    count_stat('verts', len(verts))
+    coords = yield ComputeRequest(snap_coords_to_grid, (snapshot.co[verts], axes, multiplier, matrix))
+    snapshot.set_coords(verts, coords)
+
+    duplicates = 0
+    if duplicates_mode != 'KEEP':
+        found = yield ComputeRequest(find_coincident_verts, (snapshot.co, verts, axes, multiplier, matrix))
+        duplicates = resolve_snapped_duplicates(snapshot, duplicates_mode, *found)
+    yield from snapshot.commit_steps(keep=(image_face_indexes,))
+
+    if duplicates:
+        return {'INFO'}, "{} {} duplicate vertices".format(
+            "Merged" if duplicates_mode == 'MERGE' else "Selected", duplicates)
+
+def get_view_grid(context):
+    # the grid settings moved to the overlay in 2.80
+    space = context.space_data
+    settings = getattr(space, 'overlay', space)
+    return settings.grid_scale, settings.grid_subdivisions
+
+def get_grid_matrix(scene, obj, grid_space):
+    # object space -> the space the grid is axis aligned in, None when that
+    # is object space itself
+    if grid_space == 'LOCAL':
+        return None
+    if grid_space == 'CURSOR':
+        return transform(get_cursor_matrix(scene).inverted(), obj.matrix_world)
+    return obj.matrix_world.copy()
+
+def get_cursor_matrix(scene):
+    # the cursor got a rotation in 2.80, before that it is only a location
+    cursor = getattr(scene, 'cursor', None)
+    if cursor is None:
+        return mathutils.Matrix.Translation(scene.cursor_location)
+    if hasattr(cursor, 'matrix'):
+        return cursor.matrix.copy()
+    return mathutils.Matrix.Translation(cursor.location)
+
+def resolve_snapped_duplicates(snapshot, mode, duplicates, targets):
+    # duplicates and targets from find_coincident_verts(). 'MERGE' welds the
+    # selected vertices that ended up on the same grid point as another
+    # vertex, 'SELECT' selects only those for review.
+    count_stat('duplicates', len(duplicates))
+    if len(duplicates) == 0:
+        return 0
+
+    if mode == 'MERGE':
+        snapshot.commit(keep=(image_face_indexes,))
+        snapshot.weld_verts(duplicates, targets)
+    else:
+        snapshot.select_only_verts(np.union1d(duplicates, targets))
+    return len(duplicates)
+
+@instrumented
+def coplanar_cleanup_selected(operator, context, axes, tolerance, multiplier=None):
+    # every object is clustered on its own, all of them at once on the
+    # compute pool. With a grid multiplier the clusters go to grid lines of
+    # the grid space in the preferences, and the axes are that space's.
+    scene, grid_space = context.scene, get_preferences(context).grid_space
+
+    def make_steps(obj, snapshot):
+        matrix = get_grid_matrix(scene, obj, grid_space) if multiplier is not None else None
+        return coplanar_cleanup_steps(snapshot, axes, tolerance, multiplier, matrix)
+
+    run_chunked(operator, context, "Coplanar Cleanup", lambda mesh: mesh.total_vert_sel,
+                lambda parts: object_steps(parts, make_steps))
+
+def coplanar_cleanup_steps(snapshot, axes, tolerance, multiplier=None, matrix=None):
+    # matrix is the grid matrix of the object, see get_grid_matrix()
+    if matrix is not None and matrix.determinant() == 0:
+        return {'ERROR'}, "Zero scale on an axis"
+
+    yield from snapshot.read_steps(('vert_select', 'co'))
+    verts = snapshot.selected_verts()
+    count_stat('verts', len(verts))
+    coords, clusters = yield ComputeRequest(cluster_coords, (snapshot.co[verts], axes, tolerance, multiplier, matrix))
+    count_stat('clusters', clusters)
+    snapshot.set_coords(verts, coords)
+    yield from snapshot.commit_steps(keep=(image_face_indexes,))
+    return {'INFO'}, "Collapsed {} clusters".format(clusters)
+
+@instrumented
+def audit_level(operator, context, angle_tolerance, grid_tolerance, action='REPORT'):
+    # one mesh at a time, so only one mesh worth of arrays is ever held. The
+    # grid is checked in the grid space of the preferences, a mesh used by
+    # several objects by the first of them.
+    grid_scale, grid_subdivisions = get_view_grid(context)
+    multiplier = get_grid_multiplier(grid_scale, grid_subdivisions, on_minor=True)
+    scene, grid_space = context.scene, get_preferences(context).grid_space
+    objects = [obj for obj in scene.objects if obj.type == 'MESH']
+
+    editing = context.active_object is not None and context.active_object.mode != 'OBJECT'
+    results = {}
+    with object_mode(context) if editing else contextlib.ExitStack():
+        for obj in objects:
+            if obj.data not in results:
+                snapshot = MeshSnapshot(obj.data)
+                matrix = get_grid_matrix(scene, obj, grid_space)
+                results[obj.data] = audit_mesh(snapshot, multiplier, angle_tolerance, grid_tolerance, action, matrix)
+                count_stat('meshes')
+
+    del audit_results[:]
+    for obj in objects:
+        edges, verts = results[obj.data]
+        if edges or verts:
+            audit_results.append((obj.name, edges, verts))
+        if action == 'SELECT':
+            select_object(obj, bool(edges or verts))
+    audit_results.sort(key=lambda result: result[1] + result[2], reverse=True)
+
+    operator.report({'INFO'}, "{} of {} objects have {} near axis edges and {} near grid vertices".format(
+        len(audit_results), len(objects),
+        sum(result[1] for result in audit_results), sum(result[2] for result in audit_results)))
+
+def audit_mesh(snapshot, multiplier, angle_tolerance, grid_tolerance, action='REPORT', matrix=None):
+    # returns the (near axis edges, near grid verts) found before any fix.
+    # matrix is the grid matrix of the object, objects with zero scale on an
+    # axis can't be snapped and skip the grid check.
+    co, edges = snapshot.co, snapshot.edge_verts
+    with stats_phase('compute'):
+        edge_mask = find_near_axis_edges(co, edges, angle_tolerance)
+        if matrix is not None and matrix.determinant() == 0:
+            vert_mask = np.zeros(len(co), dtype=bool)
+        else:
+            vert_mask = find_near_grid_coords(co, multiplier, grid_tolerance, matrix).any(axis=1)
+    counts = (int(np.count_nonzero(edge_mask)), int(np.count_nonzero(vert_mask)))
+    if not any(counts):
+        return counts
+
+    if action == 'SELECT':
+        snapshot.select_only_verts(np.union1d(np.flatnonzero(vert_mask), edges[edge_mask].ravel()))
+        snapshot.commit(keep=(active_elements, image_face_indexes, face_area_cache, uv_island_cache, uv_area_cache))
+    elif action == 'FIX':
+        if counts[0]:
+            with stats_phase('compute'):
+                verts, coords = solve_smart_align(co, edges[edge_mask], angle_tolerance)
+            snapshot.set_coords(verts, coords)
+        with stats_phase('compute'):
+            verts, coords = snap_near_grid_coords(snapshot.co, multiplier, grid_tolerance, matrix)
+        snapshot.set_coords(verts, coords)
+        snapshot.commit(keep=(image_face_indexes,))
+    return counts
+
+def select_object(obj, select):
+    # Object.select became select_set() in 2.80
+    if hasattr(obj, 'select_set'):
+        obj.select_set(select)
+    else:
+        obj.select = select
+
+ImageUsage = collections.namedtuple('ImageUsage', 'name draw_calls faces images flagged')
+
+@instrumented
+def image_usage_report(operator, context, min_images, max_faces_per_image, action='REPORT'):
+    # Every distinct image an object uses is counted as one draw call, the
+    # way an engine that splits meshes per material renders it. Objects with
+    # at least min_images images and fewer than max_faces_per_image faces per
+    # image are flagged as texture merging candidates.
+    use_materials = get_preferences(context).image_backend == 'MATERIAL'
+    objects = [obj for obj in context.scene.objects if obj.type == 'MESH']
+
+    editing = context.active_object is not None and context.active_object.mode != 'OBJECT'
+    usages = {}
+    with object_mode(context) if editing else contextlib.ExitStack():
+        for obj in objects:
+            if obj.data not in usages:
+                usages[obj.data] = get_mesh_image_usage(MeshSnapshot(obj.data, use_materials))
+                count_stat('meshes')
+
+    del image_usage_results[:]
+    for obj in objects:
+        names, face_slots, vector_areas = usages[obj.data]
+        with stats_phase('compute'):
+            areas = np.linalg.norm(transform_vector_areas(obj.matrix_world, vector_areas), axis=1)
+            faces, area = get_image_usage(face_slots, areas, len(names))
+
+        images = [(name, count, total) for name, count, total in zip(names, faces.tolist(), area.tolist()) if count]
+        images.sort(key=lambda image: image[1], reverse=True)
+        draw_calls = sum(1 for image in images if image[0] != None)
+        flagged = draw_calls >= min_images and len(face_slots) < draw_calls * max_faces_per_image
+        image_usage_results.append(ImageUsage(obj.name, draw_calls, len(face_slots), images, flagged))
+        if action == 'SELECT':
+            select_object(obj, flagged)
+    image_usage_results.sort(key=lambda usage: (usage.flagged, usage.draw_calls), reverse=True)
+
+    operator.report({'INFO'}, "{} draw calls for {} images over {} objects, {} flagged".format(
+        sum(usage.draw_calls for usage in image_usage_results),
+        len({image[0] for usage in image_usage_results for image in usage.images} - {None}),
+        len(objects), sum(1 for usage in image_usage_results if usage.flagged)))
+
+def get_mesh_image_usage(snapshot):
+    # (image names, index into them for every face, object space vector area
+    # of every face), both arrays come from the per mesh caches
+    if not has_face_images(snapshot):
+        return [None], np.zeros(snapshot.element_counts()[0], dtype=np.int32), get_face_vector_areas_cached(snapshot)
+
+    index = get_image_face_index(snapshot)
+    names = sorted(index.slots, key=index.slots.get)
+    return names, index.face_slots, get_face_vector_areas_cached(snapshot)
+
+def has_face_images(snapshot):
+    # without a UV map there is nowhere for the 2.7x face images to be
+    return snapshot.use_materials or snapshot.mesh.uv_textures.active is not None
+
+@instrumented
+def batch_by_image(operator, context, mode, keep_originals):
+    # 'SPLIT' turns every selected object using several images into one
+    # object per image, 'MERGE' turns all selected objects into one world
+    # space object per image. Faces whose material has no image are batched
+    # by material instead. The originals are only deleted when nothing the
+    # new objects can't carry over would be lost with them.
+    use_materials = get_preferences(context).image_backend == 'MATERIAL'
+    objects = [obj for obj in context.selected_objects if obj.type == 'MESH']
+    if not objects:
+        operator.report({'ERROR'}, 'No mesh objects selected.')
+        return
+
+    losses = [(obj.name, get_batch_losses(obj, mode)) for obj in objects]
+    losses = "; ".join("{}: {}".format(name, ", ".join(lost)) for name, lost in losses if lost)
+    if losses and not keep_originals:
+        operator.report({'ERROR'}, "Batching would lose {}. Turn on Keep Originals to batch anyway.".format(losses))
+        return
+
+    submeshes = {}
+    for obj in objects:
+        if obj.data not in submeshes:
+            submeshes[obj.data] = get_batch_submeshes(MeshSnapshot(obj.data, use_materials))
+            count_stat('meshes')
+
+    created = []
+    replaced = []
+    if mode == 'SPLIT':
+        for obj in objects:
+            if len(submeshes[obj.data]) < 2:
+                continue
+            for key, part in submeshes[obj.data]:
+                created.append(create_batch_object(
+                    context, "{}.{}".format(obj.name, get_batch_name(key)), part, key, use_materials,
+                    obj.matrix_world, obj.parent))
+            replaced.append(obj)
+    else:
+        users = collections.OrderedDict()
+        for obj in objects:
+            for key, part in submeshes[obj.data]:
+                users.setdefault(key, []).append(get_world_submesh(obj.matrix_world, part))
+        for key, parts in users.items():
+            with stats_phase('compute'):
+                part = merge_submeshes(parts)
+            created.append(create_batch_object(context, get_batch_name(key), part, key, use_materials))
+        replaced = objects
+
+    count_stat('objects', len(created))
+    for obj in objects:
+        select_object(obj, False)
+    for obj in created:
+        select_object(obj, True)
+    if not keep_originals:
+        for obj in replaced:
+            bpy.data.objects.remove(obj, do_unlink=True)
+
+    message = "{} objects batched into {}".format(len(replaced), len(created))
+    if losses:
+        operator.report({'WARNING'}, "{}. The new objects don't have the {}.".format(message, losses))
+    else:
+        operator.report({'INFO'}, message)
+
+def get_batch_losses(obj, mode):
+    # what the objects made from obj don't carry over
+    lost = []
+    if len(obj.modifiers):
+        lost.append("modifiers")
+    if len(obj.vertex_groups):
+        lost.append("vertex groups")
+    if len(obj.data.uv_layers) > 1:
+        lost.append("other UV maps")
+    if mode == 'MERGE' and obj.parent is not None:
+        lost.append("parent")
+    return lost
+
+def get_batch_name(key):
+    image_name, material_name = key
+    return image_name or material_name or "untextured"
+
+def get_batch_groups(snapshot):
+    # [((image name, material name), faces)] for the faces of the mesh. Faces
+    # are grouped by image, those whose material has no image by material,
+    # and with 2.7x face images by both, so plain materials survive.
+    materials = [material.name if material != None else None for material in snapshot.mesh.materials] or [None]
+    face_materials = np.minimum(snapshot.material_index, len(materials) - 1)
+    if not has_face_images(snapshot):
+        keys, face_keys = [(None, material) for material in materials], face_materials
+    elif snapshot.use_materials:
+        keys = [(name, None) if name != None else (None, material)
+                for name, material in zip(snapshot.slot_image_names(), materials)]
+        face_keys = face_materials
+    else:
+        names, face_slots = snapshot.image_slots()
+        keys = [(name, material) for name in names for material in materials]
+        face_keys = face_slots * len(materials) + face_materials
+
+    with stats_phase('compute'):
+        index = ImageFaceIndex(keys, face_keys)
+    return [(key, index.faces[slot]) for key, slot in index.slots.items()]
+
+def get_batch_submeshes(snapshot):
+    # [((image name, material name), (co, loop_total, loop_verts, loop_uv or
+    # None, face_smooth))] in object space, one part per group of
+    # get_batch_groups()
+    groups = get_batch_groups(snapshot)
+    has_uvs = snapshot.mesh.uv_layers.active is not None
+    loop_start, loop_total, loop_verts = snapshot.loop_start, snapshot.loop_total, snapshot.loop_verts
+    parts = []
+    for key, faces in groups:
+        if len(faces) == 0:
+            continue
+        with stats_phase('compute'):
+            verts, loops, part_loop_total, part_loop_verts = get_submesh(loop_start, loop_total, loop_verts, faces)
+        parts.append((key, (snapshot.co[verts], part_loop_total, part_loop_verts,
+                             snapshot.loop_uv[loops] if has_uvs else None, snapshot.face_smooth[faces])))
+    return parts
+
+def get_world_submesh(matrix, part):
+    co, loop_total, loop_verts, loop_uv, face_smooth = part
+    with stats_phase('compute'):
+        co = transform_coords(matrix, co)
+        if matrix.determinant() < 0:
+            # mirrored objects would come out inside out
+            loops = get_reversed_loops(loop_total)
+            loop_verts = loop_verts[loops]
+            loop_uv = loop_uv[loops] if loop_uv is not None else None
+    return co, loop_total, loop_verts, loop_uv, face_smooth
+
+def create_batch_object(context, name, part, key, use_materials, matrix=None, parent=None):
+    co, loop_total, loop_verts, loop_uv, face_smooth = part
+    image_name, material_name = key
+    mesh = bpy.data.meshes.new(name)
+    with stats_phase('write'):
+        mesh.vertices.add(len(co))
+        mesh.vertices.foreach_set('co', co.astype(np.float32).ravel())
+        mesh.loops.add(len(loop_verts))
+        mesh.loops.foreach_set('vertex_index', loop_verts.astype(np.int32))
+        mesh.polygons.add(len(loop_total))
+        mesh.polygons.foreach_set('loop_start', (np.cumsum(loop_total) - loop_total).astype(np.int32))
+        mesh.polygons.foreach_set('loop_total', loop_total.astype(np.int32))
+        mesh.polygons.foreach_set('use_smooth', face_smooth)
+        mesh.update(calc_edges=True)
+
+        image = find_image(image_name) if image_name != None else None
+        material = bpy.data.materials.get(material_name) if material_name != None else None
+        if loop_uv is not None or (image != None and not use_materials):
+            ensure_uv_layer(mesh)
+        if loop_uv is not None:
+            mesh.uv_layers.active.data.foreach_set('uv', loop_uv.ravel())
+        if image != None and use_materials:
+            mesh.materials.append(get_image_material(image))
+        elif material != None:
+            mesh.materials.append(material)
+        if image != None and not use_materials:
+            for data in mesh.uv_textures.active.data:
+                data.image = image
+
+    obj = bpy.data.objects.new(name, mesh)
+    obj.parent = parent
+    if matrix is not None:
+        obj.matrix_world = matrix
+    link_object(context, obj)
+    return obj
+
+def link_object(context, obj):
+    # objects are linked to collections from 2.80 on
+    collection = getattr(context, 'collection', None)
+    (collection or context.scene).objects.link(obj)
+
+def write_image_usage(path, usages):
+    with open(path, 'w') as usage_file:
+        for usage in usages:
+            usage_file.write(json.dumps({
+                "object": usage.name, "draw_calls": usage.draw_calls, "faces": usage.faces,
+                "flagged": usage.flagged,
+                "images": [{"image": name, "faces": faces, "area": area} for name, faces, area in usage.images],
+            }, sort_keys=True) + '\n')
+
+@instrumented
+def smart_align_selected_edges(operator, context, angle_tolerance=None):
+    run_chunked(operator, context, "Smart Align", lambda mesh: mesh.total_edge_sel,
+                lambda parts: object_steps(parts, lambda obj, snapshot: smart_align_steps(snapshot, angle_tolerance)))
+
+def smart_align_steps(snapshot, angle_tolerance=None):
+    yield from snapshot.read_steps(('edge_select', 'edge_verts', 'co'))
+    edges = snapshot.selected_edges()
+    count_stat('edges', len(edges))
+    if len(edges):
+        verts, coords = yield ComputeRequest(solve_smart_align, (snapshot.co, edges, angle_tolerance))
+        snapshot.set_coords(verts, coords)
+    yield from snapshot.commit_steps(keep=(image_face_indexes,))
+
+@instrumented
+def cube_project_selected(operator, context, cube_size):
+    # selected faces in edit mode, whole objects in object mode
+    whole_objects = context.active_object.mode != 'EDIT'
+    for obj in get_mesh_objects(context):
+        ensure_uv_layer(obj.data)
+
+    with mesh_snapshots(context) as snapshots:
+        for obj, snapshot in snapshots:
+            if whole_objects:
+                snapshot.select_everything()
+            cube_project(snapshot, obj.matrix_world, cube_size)
+            snapshot.commit(keep=(active_elements, image_face_indexes, face_area_cache))
+
+def cube_project(snapshot, matrix, cube_size):
+    projection = get_selected_cube_projection(snapshot, matrix)
+    if projection is None:
+        return 0
+
+    loops, owners, firsts, base = projection
+    with stats_phase('compute'):
+        uvs = scale_cube_projection(base, owners, firsts, cube_size)
+    snapshot.set_values('loop_uv', loops, uvs)
+    return len(firsts)
+
+def get_selected_cube_projection(snapshot, matrix):
+    # (loops, owners, firsts, unscaled uvs) of the selected faces, projected
+    # in world space so the texel density is the same on every object
+    faces = snapshot.selected_faces()
+    count_stat('faces', len(faces))
+    if len(faces) == 0:
+        return None
+
+    loops, owners, firsts = get_face_loops(snapshot.loop_start, snapshot.loop_total, faces)
+    loop_verts = snapshot.loop_verts[loops]
+    co, normals = snapshot.co, snapshot.get('face_normal')[faces]
+
+    with stats_phase('compute'):
+        base = get_cube_projection(transform_coords(matrix, co), transform_normals(matrix, normals), loop_verts, owners)
+    return loops, owners, firsts, base
+
+class CubeProjectionPreview:
+    # Cube projection of the selected faces worked out once, so a new scale
+    # only rescales the cached arrays and writes the UVs. The snapshots stay
+    # open (and object mode on, if used) until close().
+
+    def __init__(self, context):
+        whole_objects = context.active_object.mode != 'EDIT'
+        for obj in get_mesh_objects(context):
+            ensure_uv_layer(obj.data)
+
+        self.parts = []
+        with contextlib.ExitStack() as stack:
+            for obj, snapshot in stack.enter_context(mesh_snapshots(context)):
+                if whole_objects:
+                    snapshot.select_everything()
+                projection = get_selected_cube_projection(snapshot, obj.matrix_world)
+                if projection is not None:
+                    loops = projection[0]
+                    self.parts.append((snapshot, projection, snapshot.loop_uv[loops].copy()))
+            # only closed early if reading the projection failed
+            self.stack = stack.pop_all()
+
+    def apply(self, cube_size):
+        for snapshot, (loops, owners, firsts, base), original in self.parts:
+            snapshot.set_values('loop_uv', loops, scale_cube_projection(base, owners, firsts, cube_size))
+            snapshot.commit(keep=(active_elements, image_face_indexes, face_area_cache))
+
+    def restore(self):
+        for snapshot, (loops, owners, firsts, base), original in self.parts:
+            snapshot.set_values('loop_uv', loops, original)
+            snapshot.commit(keep=(active_elements, image_face_indexes, face_area_cache))
+
+    def close(self):
+        self.stack.close()
+
+@instrumented
+def start_cube_projection_preview(operator, context):
+    return CubeProjectionPreview(context)
+
+TexelDensityReport = collections.namedtuple('TexelDensityReport', 'histogram median objects')
+
+@instrumented
+def measure_texel_density(operator, context):
+    # texels per unit of every face of every mesh object in the scene, from
+    # world space face area, uv area and image size
+    use_materials = get_preferences(context).image_backend == 'MATERIAL'
+    objects = [obj for obj in context.scene.objects if obj.type == 'MESH']
+
+    editing = context.active_object is not None and context.active_object.mode != 'OBJECT'
+    measures = {}
+    with object_mode(context) if editing else contextlib.ExitStack():
+        for obj in objects:
+            if obj.data not in measures:
+                measures[obj.data] = get_mesh_texel_measures(MeshSnapshot(obj.data, use_materials))
+                count_stat('meshes')
+
+    level_densities, level_areas, rows = [], [], []
+    for obj in objects:
+        measure = measures[obj.data]
+        if measure is None:
+            continue
+        vector_areas, uv_areas, texels = measure
+        with stats_phase('compute'):
+            areas = np.linalg.norm(transform_vector_areas(obj.matrix_world, vector_areas), axis=1)
+            densities = get_texel_densities(areas, uv_areas, texels)
+        level_densities.append(densities)
+        level_areas.append(areas)
+        measured = np.isfinite(densities)
+        if measured.any():
+            rows.append((obj.name, get_weighted_median(densities, areas),
+                         float(densities[measured].min()), float(densities[measured].max())))
+
+    densities = np.concatenate(level_densities) if level_densities else np.zeros(0)
+    areas = np.concatenate(level_areas) if level_areas else np.zeros(0)
+    with stats_phase('compute'):
+        faces, bin_areas, edges = get_density_histogram(densities, areas)
+        median = get_weighted_median(densities, areas)
+    histogram = [(edges[i], edges[i + 1], int(faces[i]), bin_areas[i]) for i in range(len(faces))]
+    # the objects furthest off the level median first
+    rows.sort(key=lambda row: abs(math.log2(row[1] / median)) if row[1] > 0 else float('inf'), reverse=True)
+
+    global texel_density_report
+    texel_density_report = TexelDensityReport(histogram, median, rows)
+    count_stat('faces', len(densities))
+
+    if not rows:
+        operator.report({'WARNING'}, "No faces with a UV map, an image and an area")
+    else:
+        operator.report({'INFO'}, "Median texel density {:.1f} px/unit, {:.1f} to {:.1f} over {} objects".format(
+            median, min(row[2] for row in rows), max(row[3] for row in rows), len(rows)))
+
+def get_mesh_texel_measures(snapshot):
+    # (object space vector areas, uv areas, texels of the image) of every
+    # face from the per mesh caches, None without a UV map
+    uv_areas = get_face_uv_areas_cached(snapshot)
+    if uv_areas is None:
+        return None
+    return get_face_vector_areas_cached(snapshot), uv_areas, get_face_texels(snapshot)
+
+def get_face_texels(snapshot):
+    # pixel count of the image of every face, 0 without an image
+    if not has_face_images(snapshot):
+        return np.zeros(snapshot.element_counts()[0])
+    index = get_image_face_index(snapshot)
+    slot_texels = np.zeros(len(index.slots))
+    for name, slot in index.slots.items():
+        image = find_image(name) if name != None else None
+        if image != None:
+            slot_texels[slot] = image.size[0] * image.size[1]
+    return slot_texels[index.face_slots]
+
+@instrumented
+def normalize_texel_density(operator, context, target_density):
+    # selected faces in edit mode, whole objects in object mode. Every UV
+    # island is scaled about its center as a whole, so islands stay in one piece.
+    whole_objects = context.active_object.mode != 'EDIT'
+    islands_scaled = 0
+    with mesh_snapshots(context) as snapshots:
+        for obj, snapshot in snapshots:
+            if whole_objects:
+                snapshot.select_everything()
+            islands_scaled += normalize_mesh_texel_density(snapshot, obj.matrix_world, target_density)
+            snapshot.commit(keep=(active_elements, image_face_indexes, face_area_cache))
+
+    count_stat('islands', islands_scaled)
+    operator.report({'INFO'}, "Scaled {} UV islands to {:g} px/unit".format(islands_scaled, target_density))
+
+def normalize_mesh_texel_density(snapshot, matrix, target_density):
+    # islands with a selected face are scaled whole, so a partly selected
+    # island is not torn apart at the edge of the selection
+    faces = snapshot.selected_faces()
+    islands = get_uv_islands_cached(snapshot)
+    if len(faces) == 0 or islands is None:
+        return 0
+
+    with stats_phase('compute'):
+        faces = select_island_faces(islands, faces, np.arange(len(islands)))
+    count_stat('faces', len(faces))
+
+    vector_areas, uv_areas, texels = get_mesh_texel_measures(snapshot)
+    loop_start, loop_total, loop_uv = snapshot.loop_start, snapshot.loop_total, snapshot.loop_uv
+    with stats_phase('compute'):
+        areas = np.linalg.norm(transform_vector_areas(matrix, vector_areas[faces]), axis=1)
+        groups = np.unique(islands[faces], return_inverse=True)[1].ravel()
+        scales = get_group_uv_scales(groups, areas, uv_areas[faces], texels[faces], target_density)
+        loops, owners, firsts = get_face_loops(loop_start, loop_total, faces)
+        uvs = scale_uv_groups(loop_uv[loops], owners, groups, scales)
+    snapshot.set_values('loop_uv', loops, uvs)
+    return int(np.count_nonzero(scales != 1))
+
+def ensure_uv_layer(mesh):
+    if not mesh.uv_layers:
+        # uv_layers.new() is 2.80+, before that a UV map is added as a uv_texture
+        getattr(mesh, 'uv_textures', mesh.uv_layers).new()
+
+@instrumented
+def select_faces_with_same_image(operator, context, must_be_linked, same_island=False):
+    # same_island keeps only the faces in a UV island with a selected face
+    active_object = context.active_object
+    active = get_active_element(active_object.data)
+    run_chunked(operator, context, "Select By Image", lambda mesh: len(mesh.polygons),
+                lambda parts: select_same_image_job(parts, active_object, active, must_be_linked, same_island))
+
+def select_same_image_job(parts, active_object, active, must_be_linked, same_island=False):
+    # the image of one face is looked for on every object
+    target = find_target_face(parts, active_object, active)
+    if target is None:
+        return {'ERROR'}, nothing_selected
+
+    snapshot, face = target
+    key = get_image_key(snapshot.face_image(face))
+    return (yield from object_steps(parts, lambda obj, snapshot: select_same_image_steps(
+        snapshot, key, must_be_linked, same_island)))
+
+def find_target_face(parts, active_object, active):
+    # (snapshot, face) of the active face, or else of the first selected
+    # face, with the active object looked at first
+    parts = sorted(parts, key=lambda part: part[0].data != active_object.data)
+    if active and active.kind == 'FACE' and parts[0][0].data == active_object.data:
+        return parts[0][1], active.index
+    for obj, snapshot in parts:
+        faces = snapshot.selected_faces()
+        if len(faces):
+            return snapshot, int(faces[0])
+    return None
+
+def select_same_image_steps(snapshot, key, must_be_linked, same_island=False):
+    # only what the caches miss is read, so with a current image index the
+    # unlinked select touches nothing but the matching faces
+    seeded = must_be_linked or same_island
+    keys = ['face_select'] if seeded else []
+    index_signature = get_image_index_signature(snapshot)
+    if snapshot.use_materials and not is_cache_current(image_face_indexes, snapshot, index_signature):
+        keys.append('material_index')
+    if must_be_linked and not is_cache_current(face_adjacency_cache, snapshot, snapshot.element_counts()):
+        keys.extend(('loop_total', 'loop_edges'))
+    yield from snapshot.read_steps(keys)
+
+    face_list = snapshot.selected_faces() if seeded else None
+    if seeded and len(face_list) == 0:
+        return {'ERROR'}, nothing_selected
+
+    final_selection = get_image_face_index(snapshot).get_faces(key)
+
+    if (must_be_linked):
+        offsets, neighbours = get_face_adjacency(snapshot)
+        final_selection = yield ComputeRequest(select_linked_faces, (offsets, neighbours, face_list, final_selection))
+
+    if same_island:
+        islands = get_uv_islands_cached(snapshot)
+        if islands is None:
+            return {'ERROR'}, 'No UV map.'
+        final_selection = yield ComputeRequest(select_island_faces, (islands, face_list, final_selection))
+
+    count_stat('faces', len(final_selection))
+    snapshot.select_faces(final_selection)
+    yield from snapshot.commit_steps(keep=(active_elements, image_face_indexes, face_area_cache, uv_island_cache, uv_area_cache))
+
+@instrumented
+def select_uv_islands(operator, context):
+    run_chunked(operator, context, "Select UV Island", lambda mesh: len(mesh.polygons),
+                lambda parts: object_steps(parts, lambda obj, snapshot: select_uv_island_steps(snapshot)))
+
+def select_uv_island_steps(snapshot):
+    yield from snapshot.read_steps(('face_select', 'loop_total'))
+
+    face_list = snapshot.selected_faces()
+    if len(face_list) == 0:
+        return {'ERROR'}, nothing_selected
+
+    islands = get_uv_islands_cached(snapshot)
+    if islands is None:
+        return {'ERROR'}, 'No UV map.'
+    final_selection = yield ComputeRequest(select_island_faces, (islands, face_list, np.arange(len(islands))))
+
+    count_stat('faces', len(final_selection))
+    snapshot.select_faces(final_selection)
+    yield from snapshot.commit_steps(keep=(active_elements, image_face_indexes, face_area_cache, uv_island_cache, uv_area_cache))
+
+@instrumented
+def count_faces_with_image(context, image):
+    with mesh_snapshot(context) as snapshot:
+        return get_image_face_index(snapshot).count(get_image_key(image))
+
+@instrumented
+def get_active_face_image(operator, context):
+    with mesh_snapshot(context) as snapshot:
+        face = snapshot.active_face
+        return snapshot.face_image(face) if face != None else None
+
+@instrumented
+def assign_image_to_selected_faces(operator, context, image):
+    run_chunked(operator, context, "Assign Image", lambda mesh: mesh.total_face_sel,
+                lambda parts: object_steps(parts, lambda obj, snapshot: assign_image_steps(snapshot, image)))
+
+def assign_image_steps(snapshot, image):
+    yield from snapshot.read_steps(('face_select',))
+    assign_image_to_faces(snapshot, snapshot.selected_faces(), image)
+    yield from snapshot.commit_steps(keep=(active_elements, image_face_indexes, face_area_cache, uv_island_cache, uv_area_cache))
+
+def assign_image_to_faces(snapshot, faces, image):
+    count_stat('faces', len(faces))
+    pointer = snapshot.mesh.as_pointer()
+    cached = image_face_indexes.pop(pointer, None)
+    is_current = cached is not None and cached[0] == get_image_index_signature(snapshot)
+    slot_names = snapshot.slot_image_names()
+
+    snapshot.set_face_images(faces, image)
+
+    # the assignment may have added material slots, the index only stays
+    # valid while the slots the other faces are on keep their images
+    new_slot_names = snapshot.slot_image_names()
+    if slot_names is not None and new_slot_names[:len(slot_names)] != slot_names:
+        is_current = False
+    if is_current:
+        index = cached[1]
+        index.reassign(faces, get_image_key(image))
+        image_face_indexes[pointer] = (get_image_index_signature(snapshot), index)
+
+def reassign_image(snapshot, old_image, new_image):
+    faces = get_image_face_index(snapshot).get_faces(get_image_key(old_image)).copy()
+    assign_image_to_faces(snapshot, faces, new_image)
+    return len(faces)
+
+@instrumented
+def align_view_to_face(operator, context):
+    with mesh_snapshot(context) as snapshot:
+        try:
+            region = context.space_data.region_3d
+            face = snapshot.active_face
+            normal = snapshot.face_normal(face)
+        except (AttributeError, TypeError):
+            operator.report({'ERROR'}, 'Attribute Error')
+            return
+
+        normal = -normal
+        quat = normal.to_track_quat('-Z', 'Y')
+        region.view_rotation = quat
+
+
+@instrumented
+def align_view_to_face_under_cursor(operator, context, mouse):
+    region, rv3d = context.region, context.region_data
+    origin = view3d_utils.region_2d_to_origin_3d(region, rv3d, mouse)
+    direction = view3d_utils.region_2d_to_vector_3d(region, rv3d, mouse)
+
+    normal = ray_cast_objects(context, origin, direction)
+    if normal is None:
+        operator.report({'WARNING'}, 'No face under the cursor.')
+        return
+
+    rv3d.view_rotation = (-normal).to_track_quat('-Z', 'Y')
+
+def ray_cast_objects(context, origin, direction):
+    # world space normal of the closest face hit on any visible mesh object
+    closest, normal = None, None
+    for obj in context.visible_objects:
+        if obj.type != 'MESH':
+            continue
+        matrix = obj.matrix_world
+        try:
+            inverse = matrix.inverted()
+        except ValueError:
+            continue  # scaled to nothing
+
+        tree = get_bvh_tree(context, obj)
+        with stats_phase('ray cast'):
+            location, hit_normal, index, distance = tree.ray_cast(
+                transform(inverse, origin), transform(inverse.to_3x3(), direction))
+        count_stat('objects')
+        if location is None:
+            continue
+
+        distance = (transform(matrix, location) - origin).length
+        if closest is None or distance < closest:
+            closest = distance
+            normal = transform(inverse.to_3x3().transposed(), hit_normal).normalized()
+    return normal
+
+def get_bvh_tree(context, obj):
+    pointer = obj.as_pointer()
+    cached = bvh_trees.get(pointer)
+    count_cache('bvh tree', cached is not None and cached[0] == obj.name)
+    if cached is not None and cached[0] == obj.name:
+        return cached[1]
+
+    # FromObject takes the scene before 2.80 and the evaluated depsgraph after
+    depsgraph = context.evaluated_depsgraph_get() if hasattr(context, 'evaluated_depsgraph_get') else context.scene
+    with stats_phase('compute'):
+        tree = BVHTree.FromObject(obj, depsgraph)
+    bvh_trees[pointer] = (obj.name, tree)
+    return tree
+
+def transform(matrix, vector):
+    # matrix @ vector, mathutils only has the @ operator from 2.80 on
+    return getattr(matrix, '__matmul__', matrix.__mul__)(vector)
+
+@instrumented
+def align_to_active(operator, context, axes):
+    # The active element of the active object is the target of every object,
+    # taken to world space and from there into the grid space of each one,
+    # so the axes are the ones the grid snap uses too
+    active_object = context.active_object
+    active = get_active_element(active_object.data)
+    if active == None:
+        # operator.report({'ERROR'}, 'Nothing active to snap to.')
+        return
+    target = transform(active_object.matrix_world, active.position)
+    grid_space = get_preferences(context).grid_space
+
+    with mesh_snapshots(context) as parts:
+        selections, requests = [], []
+        for obj, snapshot in parts:
+            matrix = get_grid_matrix(context.scene, obj, grid_space)
+            try:
+                local_target = transform(obj.matrix_world.inverted(), target)
+            except ValueError:
+                operator.report({'ERROR'}, "{} has zero scale on an axis".format(obj.name))
+                return
+            grid_target = transform(matrix, local_target) if matrix is not None else local_target
+
+            verts = snapshot.selected_verts()
+            selections.append(verts)
+            requests.append(ComputeRequest(align_coords, (snapshot.co[verts], axes, tuple(grid_target), matrix)))
+        count_stat('verts', sum(len(verts) for verts in selections))
+
+        with stats_phase('compute'):
+            results = compute_all(requests)
+
+        for (obj, snapshot), verts, coords in zip(parts, selections, results):
+            if len(verts):
+                snapshot.set_coords(verts, coords)
+                # the active element is selected too, so it keeps its position.
+                # Other objects may have an active element of their own that moved.
+                if obj.data == active_object.data:
+                    snapshot.commit(keep=(active_elements, image_face_indexes))
+                else:
+                    snapshot.commit(keep=(image_face_indexes,))
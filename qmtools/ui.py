@@ -0,0 +1,970 @@
+ 
+# Quick Map Tools - menu, operators and panels
+# Copyright (C) 2018 John Cruz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# ================================================== 
+# Imports
+# ================================================== 
+
+import bpy
+import importlib
+import math
+
+# ================================================== 
+# constants / data
+# ================================================== 
+
+valid_texkeys = {'1', '2', '3', '4', '5', '6', '7', '8', '9', '0'}
+
+cubemap_scales = {
+    '1': 0.25,
+    '2': 0.5, 
+    '3': 0.75, 
+    '4': 1.0, 
+    '5': 1.25, 
+    '6': 1.5, 
+    '7': 1.75, 
+    '8': 2.0, 
+    '9': 2.25, 
+    '0': 2.5,
+}
+
+# scale change per mouse wheel step, and drag distance that doubles the scale
+cubemap_wheel_step = 1.1
+cubemap_drag_pixels = 200
+
+cubemap_modal_help = "Select Cubeprojection Scale:  "
+for k in [1,2,3,4,5,6,7,8,9,0]:
+    cubemap_modal_help += "({}) = {},  ".format(k, cubemap_scales[str(k)]) 
+
+# characters in the longest texel density histogram bar
+texel_density_bar_width = 30
+
+# ================================================== 
+# globals
+# ================================================== 
+
+addon_keymaps = []
+
+class LazyModule:
+    # Stands in for a module that is imported on first attribute access, so
+    # enabling the addon doesn't pay for numpy, the tool functions and their
+    # caches until an operator needs them.
+
+    def __init__(self, name, on_load=None):
+        self.name = name
+        self.on_load = on_load
+        self.module = None
+
+    def __getattr__(self, attr):
+        if self.module is None:
+            module = importlib.import_module(self.name)
+            self.module = module
+            if self.on_load:
+                self.on_load(module)
+        return getattr(self.module, attr)
+
+    def unload(self):
+        # the module stays in sys.modules, the next access only reruns on_load
+        self.module = None
+
+# the mesh update and file load handlers only matter once there are caches
+tools = LazyModule(__package__ + ".tools", on_load=lambda module: module.add_handlers())
+
+# ================================================== 
+# Menu
+# ================================================== 
+
+class QMToolsMenu(bpy.types.Menu):
+    bl_label = "Quick Map Tools"
+    bl_idname = "view3d.qmtools_menu"
+
+    def draw(self, context):
+        layout = self.layout
+        layout.operator_context = 'INVOKE_DEFAULT'
+
+        layout.operator(
+            "mesh.qmtools_align_z",
+            text="Z Align to Active on Z Axis")
+        layout.operator(
+            "mesh.qmtools_align_x", 
+            text="X Align to Active on X Axis" )
+        layout.operator(
+            "mesh.qmtools_align_y",
+            text="Y Align to Active on Y Axis" )
+        layout.operator(
+            "mesh.qmtools_smart_align_edges",
+            text="E Smart Align Edges" )
+        layout.operator(
+            "mesh.qmtools_align_horizontal",
+            text="H Align to Active on Both Horizontal Axes" )
+        layout.operator(
+            "mesh.qmtools_coplanar_cleanup",
+            text="C Coplanar Cleanup" )
+        layout.operator(
+            "view3d.qmtools_align_view_to_normal",
+            text="N Align View to Active Face Normal" )
+        layout.operator(
+            "view3d.qmtools_align_view_to_face_under_cursor",
+            text="V Align View to Face Under Cursor" )
+        layout.operator(
+            "uv.qmtools_quick_cubemap",
+            text="Q Quick Cubeprojection Unwrap at 1.0" )
+        layout.operator(
+            "uv.qmtools_quick_cubemap_half",
+            text="W Quick Cubeprojection Unwrap at 0.5" )
+        layout.operator(
+            "uv.qmtools_quick_cubemap_modal",
+            text="R Quick Cubemap Modal" )
+        layout.operator(
+            "uv.qmtools_normalize_texel_density",
+            text="D Normalize Texel Density" )
+        layout.operator(
+            "mesh.qmtools_minor_grid_snap",
+            text="S Snap to Minor Grid" )
+        layout.operator(
+            "mesh.qmtools_grid_snap_axis",
+            text="G Snap to Grid Along Axis" )
+        layout.operator(
+            "mesh.qmtools_grid_snap_axis_minor",
+            text="M Snap to Minor Grid Along Axis" )
+        layout.operator(
+            "mesh.qmtools_pick_image",
+            text="P Pick and Store Image" )
+        layout.operator(
+            "mesh.qmtools_assign_stored_image",
+            text="T Assign Stored Image" )
+        layout.operator(
+            "mesh.qmtools_quick_similar_image",
+            text="A Select Faces With Same Image" )    
+        layout.operator(
+            "mesh.qmtools_linked_similar_image",
+            text="F Select Linked Faces With Same Image" )    
+        layout.operator(
+            "mesh.qmtools_island_similar_image",
+            text="U Select UV Island Faces With Same Image" )
+        layout.operator(
+            "mesh.qmtools_select_uv_island",
+            text="I Select UV Island" )
+        layout.operator(
+            "mesh.qmtools_toggle_backfaces",
+            text="B Toggle Show Backfaces" )
+        layout.operator(
+            "mesh.qmtools_toggle_edge_length",
+            text="L Toggle Show length Of Edges" )
+
+# ================================================== 
+# Operators
+# ================================================== 
+
+class AlignX(bpy.types.Operator):
+    bl_idname = "mesh.qmtools_align_x"
+    bl_label = "Align To Active On X Axis"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        tools.align_to_active(self, context, (tools.X_AXIS_INDEX,))
+        return {'FINISHED'}
+
+class AlignY(bpy.types.Operator):
+    bl_idname = "mesh.qmtools_align_y"
+    bl_label = "Align To Active On Y Axis"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        tools.align_to_active(self, context, (tools.Y_AXIS_INDEX,))
+        return {'FINISHED'}
+
+class AlignZ(bpy.types.Operator):
+    bl_idname = "mesh.qmtools_align_z"
+    bl_label = "Align To Active On Z Axis"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        tools.align_to_active(self, context, (tools.Z_AXIS_INDEX,))
+        return {'FINISHED'}
+
+class AlignH(bpy.types.Operator):
+    bl_idname = "mesh.qmtools_align_horizontal"
+    bl_label = "Align To Active On Both Horizontal Axes"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        tools.align_to_active(self, context, (tools.X_AXIS_INDEX, tools.Y_AXIS_INDEX))
+        return {'FINISHED'}
+
+class AlignViewToFace(bpy.types.Operator):
+    bl_idname = "view3d.qmtools_align_view_to_normal"
+    bl_label = "Align 3d View to Active Face Normal"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        # print(type(context.space_data.region_3d.perspective_matrix))
+        tools.align_view_to_face(self, context)
+        return {'FINISHED'}
+
+class AlignViewToFaceUnderCursor(bpy.types.Operator):
+    bl_idname = "view3d.qmtools_align_view_to_face_under_cursor"
+    bl_label = "Align 3d View to Face Under Cursor"
+
+    def invoke(self, context, event):
+        if context.region_data is None:
+            return {'CANCELLED'}
+        tools.align_view_to_face_under_cursor(self, context, (event.mouse_region_x, event.mouse_region_y))
+        return {'FINISHED'}
+
+class QuickCubeMap(bpy.types.Operator):
+    bl_idname = "uv.qmtools_quick_cubemap"
+    bl_label = "Quick Cubeprojection Unwrap at 1.0" 
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        tools.cube_project_selected(self, context, 1.0)
+        return {'FINISHED'}
+
+class QuickCubeMapHalf(bpy.types.Operator):
+    bl_idname = "uv.qmtools_quick_cubemap_half"
+    bl_label = "Quick Cubeprojection Unwrap At Half Scale"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        tools.cube_project_selected(self, context, 0.5)
+        return {'FINISHED'}
+
+class NormalizeTexelDensity(bpy.types.Operator):
+    bl_idname = "uv.qmtools_normalize_texel_density"
+    bl_label = "Normalize Texel Density"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    target_density = bpy.props.FloatProperty(
+        name="Target Density",
+        description="Texels of the face image per unit of length",
+        default=128.0,
+        min=0.001)
+
+    def execute(self, context):
+        tools.normalize_texel_density(self, context, self.target_density)
+        return {'FINISHED'}
+
+class QuickSimilarImage(bpy.types.Operator):
+    bl_idname = "mesh.qmtools_quick_similar_image"
+    bl_label = "Quick Select Faces With Same Image"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        # bpy.ops.mesh.select_similar(type='IMAGE', threshold=0.01)
+        tools.select_faces_with_same_image(self, context, must_be_linked=False)
+        return {'FINISHED'}
+
+class SelectLinkedFaceSameImage(bpy.types.Operator):
+    bl_idname = "mesh.qmtools_linked_similar_image"
+    bl_label = "Select Linked Faces With Same Image"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        tools.select_faces_with_same_image(self, context, must_be_linked=True)
+        return {'FINISHED'}
+
+class SelectIslandFaceSameImage(bpy.types.Operator):
+    bl_idname = "mesh.qmtools_island_similar_image"
+    bl_label = "Select UV Island Faces With Same Image"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        tools.select_faces_with_same_image(self, context, must_be_linked=False, same_island=True)
+        return {'FINISHED'}
+
+class SelectUVIsland(bpy.types.Operator):
+    bl_idname = "mesh.qmtools_select_uv_island"
+    bl_label = "Select UV Island"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        tools.select_uv_islands(self, context)
+        return {'FINISHED'}
+
+class SmartAlignEdges(bpy.types.Operator):
+    bl_idname = "mesh.qmtools_smart_align_edges"
+    bl_label = "Edge Smart Align"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    angle_tolerance = bpy.props.FloatProperty(
+        name="Angle Tolerance",
+        description="Leave edges that are further than this from their closest axis alone",
+        subtype='ANGLE',
+        default=math.radians(90),
+        min=0.0,
+        max=math.radians(90))
+
+    def execute(self, context):
+        tools.smart_align_selected_edges(self, context, self.angle_tolerance)
+        return {'FINISHED'}
+
+class CoplanarCleanup(bpy.types.Operator):
+    bl_idname = "mesh.qmtools_coplanar_cleanup"
+    bl_label = "Coplanar Cleanup"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    axes = bpy.props.BoolVectorProperty(
+        name="Axes",
+        description="Axes to clean up",
+        subtype='XYZ',
+        default=(True, True, True))
+
+    tolerance = bpy.props.FloatProperty(
+        name="Tolerance",
+        description="Values closer than this to their neighbour on an axis are merged",
+        subtype='DISTANCE',
+        default=0.001,
+        min=0.0,
+        precision=4)
+
+    target = bpy.props.EnumProperty(
+        name="Snap To",
+        items=[
+            ('MEAN', "Mean", "Move every group to the mean of its values"),
+            ('MINOR_GRID', "Minor Grid", "Move every group to the minor grid line closest to its mean"),
+            ('MAJOR_GRID', "Major Grid", "Move every group to the major grid line closest to its mean"),
+        ],
+        default='MEAN')
+
+    def execute(self, context):
+        axes = [axis for axis, enabled in enumerate(self.axes) if enabled]
+        multiplier = None
+        if self.target != 'MEAN':
+            grid_scale, grid_subdivisions = tools.get_view_grid(context)
+            multiplier = tools.get_grid_multiplier(grid_scale, grid_subdivisions, self.target == 'MINOR_GRID')
+        tools.coplanar_cleanup_selected(self, context, axes, self.tolerance, multiplier)
+        return {'FINISHED'}
+
+class ToggleBackfaces(bpy.types.Operator):
+    bl_idname = "mesh.qmtools_toggle_backfaces"
+    bl_label = "Toggle Show Backfaces"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        context.space_data.show_backface_culling ^= True
+        return {'FINISHED'}
+
+class ToggleEdgeLength(bpy.types.Operator):
+    bl_idname = "mesh.qmtools_toggle_edge_length"
+    bl_label = "Toggle Show Length Of Edges"
+    bl_options = {'REGISTER', 'UNDO'} 
+
+    def execute(self, context):
+        context.object.data.show_extra_edge_length ^= True
+        return {'FINISHED'}
+
+class QuickCubeMapModal(bpy.types.Operator):
+    bl_idname = "uv.qmtools_quick_cubemap_modal"
+    bl_label = "Quick Cubeprojection Modal"
+    bl_options = {'REGISTER', 'UNDO', 'BLOCKING'}
+
+    def modal(self, context, event):
+        if event.unicode in cubemap_scales.keys():
+            self.preview.apply(cubemap_scales[event.unicode])
+            return self.finish(context, {'FINISHED'})
+
+        if event.type in {'RET', 'NUMPAD_ENTER', 'LEFTMOUSE'} and event.value == 'PRESS':
+            return self.finish(context, {'FINISHED'})
+
+        if event.type in {'ESC', 'RIGHTMOUSE'}:
+            self.preview.restore()
+            return self.finish(context, {'CANCELLED'})
+
+        if event.type in {'WHEELUPMOUSE', 'WHEELDOWNMOUSE', 'MOUSEMOVE'}:
+            if event.type == 'WHEELUPMOUSE':
+                self.wheel_scale *= cubemap_wheel_step
+            elif event.type == 'WHEELDOWNMOUSE':
+                self.wheel_scale /= cubemap_wheel_step
+            # dragging right doubles the scale every cubemap_drag_pixels
+            drag = (event.mouse_x - self.start_x) / cubemap_drag_pixels
+            self.scale = self.wheel_scale * 2 ** drag
+            self.preview.apply(self.scale)
+            self.set_header(context)
+
+        return {'RUNNING_MODAL'}
+
+    def invoke(self, context, event):
+        self.preview = tools.start_cube_projection_preview(self, context)
+        if not self.preview.parts:
+            self.preview.close()
+            return {'CANCELLED'}
+
+        self.start_x = event.mouse_x
+        self.wheel_scale = self.scale = 1.0
+        self.preview.apply(self.scale)
+        self.set_header(context)
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def set_header(self, context):
+        context.area.header_text_set("Scale: {:.3f}  (Drag / Wheel, Enter to apply, Esc to cancel)  {}".format(
+            self.scale, cubemap_modal_help))
+
+    def finish(self, context, result):
+        self.preview.close()
+        context.area.header_text_set()
+        return result
+
+class PickImageModal(bpy.types.Operator):
+    bl_idname = "mesh.qmtools_pick_image"
+    bl_label = "Pick And Store Image"
+    bl_options = {'REGISTER', 'UNDO', 'BLOCKING'}
+
+    def modal(self, context, event):
+        context.area.header_text_set("Pick Image: Select slot (0-9) to store image in.")
+        if event.unicode in valid_texkeys:
+            context.area.header_text_set()
+            image = tools.get_active_face_image(self, context)
+            if image == None:
+                self.report({'ERROR'}, 'Active face has no image.')
+                return {'CANCELLED'}
+            tools.stored_images[event.unicode] = tools.StoredImage(image)
+            self.report({'INFO'}, "Stored {} in slot {}, used by {} faces".format(
+                image.name, event.unicode, tools.count_faces_with_image(context, image)))
+            return {'FINISHED'}
+
+        if event.type == 'ESC':
+            context.area.header_text_set()
+            return {'CANCELLED'}
+
+        return {'RUNNING_MODAL'}
+
+    def invoke(self, context, event):
+        # stored_images[0] = StoredImage(get_active_face_image(self, context))
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+class AssignImageModal(bpy.types.Operator):
+    bl_idname = "mesh.qmtools_assign_stored_image"
+    bl_label = "Assign Stored Image"
+    bl_options = {'REGISTER', 'UNDO', 'BLOCKING'}
+
+    def modal(self, context, event):
+        context.area.header_text_set("Assign Image: Select slot (0-9) to assign image from")
+        if event.unicode in valid_texkeys:
+            image = tools.get_stored_image(event.unicode)
+            if image != None:
+                tools.assign_image_to_selected_faces(self, context, image)
+                context.area.header_text_set()
+                return {'FINISHED'}
+            else:
+                context.area.header_text_set()
+                return {'CANCELLED'}
+
+        if event.type == 'ESC':
+            context.area.header_text_set()
+            return {'CANCELLED'}
+
+        return {'RUNNING_MODAL'}
+
+    def invoke(self, context, event):
+        # assign_image_to_selected_faces(self, context, get_stored_image('0'))
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+class SnapToMinorGrid(bpy.types.Operator):
+    bl_idname = "mesh.qmtools_minor_grid_snap"
+    bl_label = "Snap To Minor Grid"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        tools.align_to_grid_on_axes(self, context, (tools.X_AXIS_INDEX, tools.Y_AXIS_INDEX, tools.Z_AXIS_INDEX), on_minor=True)
+        return {'FINISHED'}
+
+
+class GridSnapModal(bpy.types.Operator):
+    bl_idname = "mesh.qmtools_grid_snap_axis"
+    bl_label = "Snap to Major Grid On Axis"
+    bl_options = {'REGISTER', 'UNDO', 'BLOCKING'}
+
+    def modal(self, context, event):
+        context.area.header_text_set("Select X Y or Z to snap selectd vertices to the major grid on that axis.")
+        if event.type == 'X':
+            tools.align_to_grid_on_axes(self, context, (tools.X_AXIS_INDEX,), on_minor=False)
+            context.area.header_text_set()
+            return {'FINISHED'}
+        if event.type == 'Y':
+            tools.align_to_grid_on_axes(self, context, (tools.Y_AXIS_INDEX,), on_minor=False)
+            context.area.header_text_set()
+            return {'FINISHED'}
+        if event.type == 'Z':
+            tools.align_to_grid_on_axes(self, context, (tools.Z_AXIS_INDEX,), on_minor=False)
+            context.area.header_text_set()
+            return {'FINISHED'}
+
+        if event.type == 'ESC':
+            context.area.header_text_set()
+            return {'CANCELLED'}
+
+        return {'RUNNING_MODAL'}
+
+    def invoke(self, context, event):
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+class GridSnapMinorModal(bpy.types.Operator):
+    bl_idname = "mesh.qmtools_grid_snap_axis_minor"
+    bl_label = "Snap to Minor Grid On Axis"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def modal(self, context, event):
+        context.area.header_text_set("Select X Y or Z to snap selectd vertices to the minor grid on that axis.")
+        if event.type == 'X':
+            tools.align_to_grid_on_axes(self, context, (tools.X_AXIS_INDEX,), on_minor=True)
+            context.area.header_text_set()
+            return {'FINISHED'}
+        if event.type == 'Y':
+            tools.align_to_grid_on_axes(self, context, (tools.Y_AXIS_INDEX,), on_minor=True)
+            context.area.header_text_set()
+            return {'FINISHED'}
+        if event.type == 'Z':
+            tools.align_to_grid_on_axes(self, context, (tools.Z_AXIS_INDEX,), on_minor=True)
+            context.area.header_text_set()
+            return {'FINISHED'}
+
+        if event.type == 'ESC':
+            context.area.header_text_set()
+            return {'CANCELLED'}
+
+        return {'RUNNING_MODAL'}
+
+    def invoke(self, context, event):
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+class AuditLevel(bpy.types.Operator):
+    bl_idname = "object.qmtools_audit_level"
+    bl_label = "Audit Level Alignment"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    action = bpy.props.EnumProperty(
+        name="Action",
+        items=[
+            ('REPORT', "Report", "Only count the problems of every mesh object in the scene"),
+            ('SELECT', "Select", "Select the objects with problems and only the offending vertices and edges in them"),
+            ('FIX', "Fix", "Straighten the near axis edges and snap the near grid vertices"),
+        ],
+        default='REPORT')
+
+    angle_tolerance = bpy.props.FloatProperty(
+        name="Angle Tolerance",
+        description="Edges closer than this to their closest axis should be on it",
+        subtype='ANGLE',
+        default=math.radians(5),
+        min=0.0,
+        max=math.radians(45))
+
+    grid_tolerance = bpy.props.FloatProperty(
+        name="Grid Tolerance",
+        description="Vertices closer than this to a minor grid line on an axis should be on it",
+        subtype='DISTANCE',
+        default=0.01,
+        min=0.0,
+        precision=4)
+
+    def execute(self, context):
+        tools.audit_level(self, context, self.angle_tolerance, self.grid_tolerance, self.action)
+        return {'FINISHED'}
+
+class ImageUsageReport(bpy.types.Operator):
+    bl_idname = "object.qmtools_image_usage"
+    bl_label = "Report Image Usage"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    action = bpy.props.EnumProperty(
+        name="Action",
+        items=[
+            ('REPORT', "Report", "Count the faces, area and draw calls of every image on every mesh object"),
+            ('SELECT', "Select", "Select only the objects using many images for few faces"),
+        ],
+        default='REPORT')
+
+    min_images = bpy.props.IntProperty(
+        name="Minimum Images",
+        description="Objects with fewer images than this are never flagged",
+        default=3,
+        min=2)
+
+    max_faces_per_image = bpy.props.IntProperty(
+        name="Faces Per Image",
+        description="Flag objects with fewer faces than this per image they use",
+        default=50,
+        min=1)
+
+    def execute(self, context):
+        tools.image_usage_report(self, context, self.min_images, self.max_faces_per_image, self.action)
+        return {'FINISHED'}
+
+class MeasureTexelDensity(bpy.types.Operator):
+    bl_idname = "object.qmtools_texel_density"
+    bl_label = "Measure Texel Density"
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+        tools.measure_texel_density(self, context)
+        return {'FINISHED'}
+
+class BatchByImage(bpy.types.Operator):
+    bl_idname = "object.qmtools_batch_by_image"
+    bl_label = "Batch Objects By Image"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    mode = bpy.props.EnumProperty(
+        name="Mode",
+        items=[
+            ('SPLIT', "Split", "Split every selected object that uses several images into one object per image"),
+            ('MERGE', "Merge", "Merge the faces of all selected objects into one object per image"),
+        ],
+        default='SPLIT')
+
+    keep_originals = bpy.props.BoolProperty(
+        name="Keep Originals",
+        description="Keep the objects that were split or merged instead of deleting them. Objects with "
+                    "modifiers, vertex groups or several UV maps are only batched with this on",
+        default=True)
+
+    @classmethod
+    def poll(cls, context):
+        return context.mode == 'OBJECT'
+
+    def execute(self, context):
+        tools.batch_by_image(self, context, self.mode, self.keep_originals)
+        return {'FINISHED'}
+
+class ChunkedRunner(bpy.types.Operator):
+    bl_idname = "wm.qmtools_run_chunked"
+    bl_label = "Quick Map Tools Progress"
+    bl_options = {'REGISTER', 'UNDO', 'BLOCKING', 'INTERNAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.job.cancel()
+            self.report({'INFO'}, "{} cancelled".format(self.job.label))
+            return self.finish(context, {'CANCELLED'})
+
+        if event.type == 'TIMER':
+            if self.job.run(tools.chunk_time_budget):
+                self.job.report(self)
+                return self.finish(context, {'FINISHED'})
+            context.area.header_text_set("{}: {} {:.0f}%  (Esc to cancel)".format(
+                self.job.label, self.job.phase, self.job.progress * 100))
+
+        return {'RUNNING_MODAL'}
+
+    def invoke(self, context, event):
+        if not tools.pending_jobs:
+            return {'CANCELLED'}
+        self.job = tools.pending_jobs.pop()
+        self.timer = context.window_manager.event_timer_add(tools.chunk_timer_interval, window=context.window)
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def finish(self, context, result):
+        context.window_manager.event_timer_remove(self.timer)
+        context.area.header_text_set()
+        return result
+
+# ================================================== 
+# Preferences
+# ================================================== 
+
+class QMToolsPreferences(bpy.types.AddonPreferences):
+    bl_idname = __package__
+
+    use_edit_mesh = bpy.props.BoolProperty(
+        name="Work Directly On Edit Mesh",
+        description="Run operators on the edit-mode BMesh instead of switching to object mode and back",
+        default=True)
+
+    image_backend = bpy.props.EnumProperty(
+        name="Face Images",
+        description="Where the image of a face is stored",
+        items=[
+            ('MATERIAL', "Material Slots", "One material per image, faces pick theirs with the material index"),
+            ('UV_TEXTURE', "UV Face Images", "The image of the active UV map face, Blender 2.7x only"),
+        ],
+        default='MATERIAL')
+
+    snap_duplicates = bpy.props.EnumProperty(
+        name="Duplicates After Grid Snap",
+        description="What to do with vertices that grid snapping put on top of another vertex",
+        items=[
+            ('KEEP', "Keep", "Leave them alone"),
+            ('SELECT', "Select", "Select only the coincident vertices for review"),
+            ('MERGE', "Merge", "Weld every coincident vertex into one"),
+        ],
+        default='KEEP')
+
+    grid_space = bpy.props.EnumProperty(
+        name="Snap Grid Space",
+        description="Space the grid that vertices are snapped to is axis aligned in",
+        items=[
+            ('WORLD', "World", "Snap in world space, also for moved, rotated and scaled objects"),
+            ('LOCAL', "Object", "Snap in the object's own space"),
+            ('CURSOR', "3D Cursor", "Snap to a grid with its origin, and from 2.80 on its rotation, at the 3D cursor"),
+        ],
+        default='WORLD')
+
+    chunk_threshold = bpy.props.IntProperty(
+        name="Run In Steps Above",
+        description="Selections with more elements than this are processed in steps with a progress "
+                    "display and can be cancelled with Esc",
+        default=200000,
+        min=0)
+
+    collect_stats = bpy.props.BoolProperty(
+        name="Collect Stats",
+        description="Time the phases of every qmtools operator and count the elements and cache hits",
+        default=False)
+
+    stats_log_path = bpy.props.StringProperty(
+        name="Stats Log",
+        description="Append the stats of every operator run to this file as JSON lines",
+        subtype='FILE_PATH')
+
+    def draw(self, context):
+        layout = self.layout
+        layout.prop(self, "use_edit_mesh")
+        layout.prop(self, "image_backend")
+        layout.prop(self, "snap_duplicates")
+        layout.prop(self, "grid_space")
+        layout.prop(self, "chunk_threshold")
+        layout.prop(self, "collect_stats")
+        layout.prop(self, "stats_log_path")
+
+# ================================================== 
+# Stats panel
+# ================================================== 
+
+class QMToolsStatsPanel(bpy.types.Panel):
+    bl_label = "Quick Map Tools Stats"
+    bl_idname = "VIEW3D_PT_qmtools_stats"
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = "Quick Map Tools"
+
+    def draw(self, context):
+        layout = self.layout
+        preferences = getattr(context, 'preferences', None) or context.user_preferences
+        addon = preferences.addons.get(__package__)
+        if addon:
+            layout.prop(addon.preferences, "collect_stats")
+
+        row = layout.row(align=True)
+        row.operator("wm.qmtools_export_stats", text="Export")
+        row.operator("wm.qmtools_clear_stats", text="Clear")
+
+        # nothing was recorded before the tools are loaded, don't load them to draw that
+        if tools.module is None:
+            return
+
+        for stats in list(tools.recent_stats)[:tools.stats_panel_rows]:
+            box = layout.box()
+            box.label(text="{}: {:.1f} ms".format(stats.name, stats.total * 1000))
+            for name, seconds in stats.phases.items():
+                box.label(text="    {}: {:.1f} ms".format(name, seconds * 1000))
+            for name, amount in stats.counts.items():
+                box.label(text="    {}: {}".format(name, amount))
+
+class QMToolsAuditPanel(bpy.types.Panel):
+    bl_label = "Quick Map Tools Audit"
+    bl_idname = "VIEW3D_PT_qmtools_audit"
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = "Quick Map Tools"
+
+    def draw(self, context):
+        layout = self.layout
+        row = layout.row(align=True)
+        for action, text in (('REPORT', "Audit"), ('SELECT', "Select"), ('FIX', "Fix")):
+            row.operator("object.qmtools_audit_level", text=text).action = action
+
+        if tools.module is None:
+            return
+
+        for name, edges, verts in tools.audit_results[:tools.audit_panel_rows]:
+            layout.label(text="{}: {} edges, {} verts".format(name, edges, verts))
+        if len(tools.audit_results) > tools.audit_panel_rows:
+            layout.label(text="... {} more objects".format(len(tools.audit_results) - tools.audit_panel_rows))
+
+class QMToolsImageUsagePanel(bpy.types.Panel):
+    bl_label = "Quick Map Tools Image Usage"
+    bl_idname = "VIEW3D_PT_qmtools_image_usage"
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = "Quick Map Tools"
+
+    def draw(self, context):
+        layout = self.layout
+        row = layout.row(align=True)
+        for action, text in (('REPORT', "Report"), ('SELECT', "Select Flagged")):
+            row.operator("object.qmtools_image_usage", text=text).action = action
+        row.operator("wm.qmtools_export_image_usage", text="Export")
+        row = layout.row(align=True)
+        for mode, text in (('SPLIT', "Split By Image"), ('MERGE', "Merge By Image")):
+            row.operator("object.qmtools_batch_by_image", text=text).mode = mode
+
+        if tools.module is None:
+            return
+
+        usages = tools.image_usage_results
+        for usage in usages[:tools.image_usage_panel_rows]:
+            layout.label(text="{}: {} draw calls, {} faces".format(usage.name, usage.draw_calls, usage.faces),
+                         icon='ERROR' if usage.flagged else 'NONE')
+        if len(usages) > tools.image_usage_panel_rows:
+            layout.label(text="... {} more objects".format(len(usages) - tools.image_usage_panel_rows))
+
+class QMToolsTexelDensityPanel(bpy.types.Panel):
+    bl_label = "Quick Map Tools Texel Density"
+    bl_idname = "VIEW3D_PT_qmtools_texel_density"
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = "Quick Map Tools"
+
+    def draw(self, context):
+        layout = self.layout
+        row = layout.row(align=True)
+        row.operator("object.qmtools_texel_density", text="Measure")
+        row.operator("uv.qmtools_normalize_texel_density", text="Normalize")
+
+        if tools.module is None or tools.texel_density_report is None:
+            return
+
+        report = tools.texel_density_report
+        if report.histogram:
+            layout.label(text="Median {:.1f} px/unit".format(report.median))
+            box = layout.box()
+            largest = max(area for low, high, faces, area in report.histogram) or 1.0
+            for low, high, faces, area in report.histogram:
+                box.label(text="{:g}-{:g}: {} faces {}".format(
+                    low, high, faces, "|" * int(round(texel_density_bar_width * area / largest))))
+
+        for name, median, lowest, highest in report.objects[:tools.texel_density_panel_rows]:
+            layout.label(text="{}: {:.1f} ({:.1f}-{:.1f})".format(name, median, lowest, highest))
+        if len(report.objects) > tools.texel_density_panel_rows:
+            layout.label(text="... {} more objects".format(len(report.objects) - tools.texel_density_panel_rows))
+
+class ExportStats(bpy.types.Operator):
+    bl_idname = "wm.qmtools_export_stats"
+    bl_label = "Export Quick Map Tools Stats"
+
+    filepath = bpy.props.StringProperty(subtype='FILE_PATH')
+
+    def execute(self, context):
+        tools.write_stats(self.filepath, reversed(tools.recent_stats))
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        self.filepath = "qmtools_stats.jsonl"
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+class ExportImageUsage(bpy.types.Operator):
+    bl_idname = "wm.qmtools_export_image_usage"
+    bl_label = "Export Quick Map Tools Image Usage"
+
+    filepath = bpy.props.StringProperty(subtype='FILE_PATH')
+
+    def execute(self, context):
+        tools.write_image_usage(self.filepath, tools.image_usage_results)
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        self.filepath = "qmtools_image_usage.jsonl"
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+class ClearStats(bpy.types.Operator):
+    bl_idname = "wm.qmtools_clear_stats"
+    bl_label = "Clear Quick Map Tools Stats"
+
+    def execute(self, context):
+        tools.recent_stats.clear()
+        return {'FINISHED'}
+
+# ================================================== 
+# Registration
+# ================================================== 
+
+classes = (
+    QMToolsMenu,
+    AlignX,
+    AlignY,
+    AlignZ,
+    AlignH,
+    AlignViewToFace,
+    AlignViewToFaceUnderCursor,
+    QuickCubeMap,
+    QuickCubeMapHalf,
+    QuickSimilarImage,
+    SelectLinkedFaceSameImage,
+    SelectIslandFaceSameImage,
+    SelectUVIsland,
+    NormalizeTexelDensity,
+    SmartAlignEdges,
+    CoplanarCleanup,
+    ToggleBackfaces,
+    ToggleEdgeLength,
+    QuickCubeMapModal,
+    PickImageModal,
+    AssignImageModal,
+    SnapToMinorGrid,
+    GridSnapModal,
+    GridSnapMinorModal,
+    AuditLevel,
+    ImageUsageReport,
+    BatchByImage,
+    MeasureTexelDensity,
+    ChunkedRunner,
+    QMToolsPreferences,
+    QMToolsStatsPanel,
+    QMToolsAuditPanel,
+    QMToolsImageUsagePanel,
+    QMToolsTexelDensityPanel,
+    ExportStats,
+    ExportImageUsage,
+    ClearStats,
+)
+
+def register():
+    for cls in classes:
+        bpy.utils.register_class(cls)
+
+    # there is no addon keyconfig in background mode
+    kc = bpy.context.window_manager.keyconfigs.addon
+    if kc:
+        km = kc.keymaps.new(name="Mesh")
+
+        kmi = km.keymap_items.new('wm.call_menu', 'Q', 'PRESS')
+        kmi.properties.name = QMToolsMenu.bl_idname
+
+        addon_keymaps.append(km)
+
+def unregister():
+    if tools.module is not None:
+        tools.remove_handlers()
+        tools.shutdown_compute_pool()
+        tools.unload()
+
+    wm = bpy.context.window_manager
+    for km in addon_keymaps:
+        wm.keyconfigs.addon.keymaps.remove(km)
+    addon_keymaps.clear()
+
+    for cls in reversed(classes):
+        bpy.utils.unregister_class(cls)
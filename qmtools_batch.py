@@ -0,0 +1,404 @@
+# Quick Map Tools - headless batch runner
+# Copyright (C) 2018 John Cruz
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Runs qmtools cleanup passes over many .blend files:
+#
+#   blender --background --factory-startup --python qmtools_batch.py -- \
+#       --op grid_snap --op smart_align --grid-scale 1 --grid-subdivisions 10 \
+#       --jobs 4 levels/
+#
+# The Blender started by the command above only hands out work. It launches
+# --jobs worker Blender processes and feeds them one file at a time over
+# stdin, and every finished file is streamed as one JSON line on stdout.
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+# ==================================================
+# constants / data
+# ==================================================
+
+RESULT_PREFIX = "QMTOOLS_RESULT "
+
+OPERATIONS = ('grid_snap', 'smart_align', 'coplanar_cleanup', 'reassign_image')
+
+AXES = {'x': 0, 'y': 1, 'z': 2}
+
+# ==================================================
+# Arguments
+# ==================================================
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="qmtools_batch",
+        description="Apply Quick Map Tools cleanup passes to many .blend files.")
+    parser.add_argument("files", nargs="*",
+        help=".blend files or directories to search for them")
+    parser.add_argument("--op", dest="ops", action="append", choices=OPERATIONS, default=[],
+        help="operation to run, repeat to run several in the given order")
+    parser.add_argument("--grid-scale", type=float, default=1.0,
+        help="grid scale used by grid_snap")
+    parser.add_argument("--grid-subdivisions", type=int, default=10,
+        help="grid subdivisions used by grid_snap")
+    parser.add_argument("--grid-major", action="store_true",
+        help="snap to the major grid instead of the minor grid")
+    parser.add_argument("--grid-space", choices=("world", "local", "cursor"), default="world",
+        help="space grid_snap rounds in, meshes used by several objects snap with the first one")
+    parser.add_argument("--merge-duplicates", action="store_true",
+        help="weld the vertices grid_snap puts on top of another vertex")
+    parser.add_argument("--axes", default="xyz",
+        help="axes snapped by grid_snap and coplanar_cleanup")
+    parser.add_argument("--angle-tolerance", type=float, default=None, metavar="DEGREES",
+        help="smart_align leaves edges further than this from their closest axis alone")
+    parser.add_argument("--tolerance", type=float, default=0.001,
+        help="coplanar_cleanup merges axis values closer than this")
+    parser.add_argument("--reassign", action="append", default=[], metavar="OLD=NEW",
+        help="image names swapped by reassign_image")
+    parser.add_argument("--image-backend", choices=("material", "uv_texture"), default="material",
+        help="read and write face images through material slots or 2.7x UV face images")
+    parser.add_argument("--selected-only", action="store_true",
+        help="only touch the geometry selected in each file instead of whole meshes")
+    parser.add_argument("--output-dir",
+        help="save processed files here, below their path inside the given directory, instead of overwriting them")
+    parser.add_argument("--dry-run", action="store_true",
+        help="do not save anything")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+        help="number of worker Blender processes")
+    parser.add_argument("--blender",
+        help="Blender executable for the workers, defaults to the running one")
+    parser.add_argument("--results",
+        help="also write the JSON lines to this file")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+
+    args = parser.parse_args(argv)
+    if not args.ops:
+        parser.error("no --op given")
+    if set(args.axes) - set(AXES):
+        parser.error("--axes may only contain x, y and z")
+    for pair in args.reassign:
+        if "=" not in pair:
+            parser.error("--reassign expects OLD=NEW, got {}".format(pair))
+    return args
+
+def get_worker_argv(args):
+    # the parsed options again for the worker command line, without the
+    # files (they go over stdin) and the options only the controller uses
+    argv = ["--worker"] + ["--op=" + op for op in args.ops] + [
+        "--grid-scale={!r}".format(args.grid_scale),
+        "--grid-subdivisions={}".format(args.grid_subdivisions),
+        "--grid-space=" + args.grid_space,
+        "--axes=" + args.axes,
+        "--tolerance={!r}".format(args.tolerance),
+        "--image-backend=" + args.image_backend,
+    ] + ["--reassign=" + pair for pair in args.reassign]
+    if args.angle_tolerance is not None:
+        argv.append("--angle-tolerance={!r}".format(args.angle_tolerance))
+    if args.output_dir:
+        argv.append("--output-dir=" + os.path.abspath(args.output_dir))
+    for flag in ("grid_major", "merge_duplicates", "selected_only", "dry_run"):
+        if getattr(args, flag):
+            argv.append("--" + flag.replace("_", "-"))
+    return argv
+
+def get_script_args():
+    return sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+
+def find_blend_files(paths):
+    # (path, output name) of every file, the output name is the path below
+    # the directory it was found in so --output-dir keeps the folder layout
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend((os.path.join(root, name), os.path.relpath(os.path.join(root, name), path))
+                             for name in sorted(names) if name.endswith(".blend"))
+        else:
+            files.append((path, os.path.basename(path)))
+    return [(os.path.abspath(path), name) for path, name in files]
+
+def find_output_clash(files):
+    # (first path, second path, output name) of two files saved to the same place, or None
+    outputs = {}
+    for path, name in files:
+        key = os.path.normcase(os.path.normpath(name))
+        if key in outputs and outputs[key] != path:
+            return outputs[key], path, name
+        outputs[key] = path
+    return None
+
+# ==================================================
+# Controller
+# ==================================================
+
+def run_controller(args):
+    blender = args.blender or (bpy.app.binary_path if bpy else None)
+    if not blender:
+        sys.exit("qmtools_batch: pass --blender when not running inside Blender")
+
+    files = find_blend_files(args.files)
+    clash = find_output_clash(files) if args.output_dir else None
+    if clash:
+        sys.exit("qmtools_batch: {} and {} would both be saved as {}".format(*clash))
+
+    work = queue.Queue()
+    for path, name in files:
+        work.put((path, name))
+
+    command = [blender, "--background", "--factory-startup", "--python", os.path.abspath(__file__),
+        "--"] + get_worker_argv(args)
+
+    results_file = open(args.results, "w") if args.results else None
+    lock = threading.Lock()
+    failures = []
+
+    def emit(result):
+        line = json.dumps(result, sort_keys=True)
+        with lock:
+            print(line, flush=True)
+            if results_file:
+                results_file.write(line + "\n")
+                results_file.flush()
+            if not result["ok"]:
+                failures.append(result["file"])
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=drive_worker, args=(command, work, emit))
+               for _ in range(max(1, min(args.jobs, len(files))))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if results_file:
+        results_file.close()
+
+    sys.stderr.write("qmtools_batch: {} files, {} failed, {:.2f}s\n".format(
+        len(files), len(failures), time.perf_counter() - start))
+    sys.exit(1 if failures else 0)
+
+def drive_worker(command, work, emit):
+    process = None
+    try:
+        while True:
+            try:
+                path, name = work.get_nowait()
+            except queue.Empty:
+                break
+
+            if process is None or process.poll() is not None:
+                try:
+                    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                        universal_newlines=True)
+                except OSError as error:
+                    # no worker can be started, so nothing left in the queue gets processed
+                    process = None
+                    fail_queue(work, emit, path, "could not start worker: {}".format(error))
+                    break
+
+            try:
+                process.stdin.write(json.dumps({"file": path, "output": name}) + "\n")
+                process.stdin.flush()
+            except OSError:
+                pass  # the worker died, read_result() reports it
+            emit(read_result(process, path))
+    finally:
+        if process is not None and process.poll() is None:
+            process.stdin.close()
+            process.wait()
+
+def fail_queue(work, emit, path, error):
+    # reports path and every file still waiting as failed
+    while path is not None:
+        emit({"file": path, "ok": False, "error": error})
+        try:
+            path, name = work.get_nowait()
+        except queue.Empty:
+            path = None
+
+def read_result(process, path):
+    # worker output is mixed with Blender's own messages
+    for line in process.stdout:
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+
+    return {"file": path, "ok": False,
+            "error": "worker exited with code {}".format(process.wait())}
+
+# ==================================================
+# Worker
+# ==================================================
+
+def run_worker(args):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from qmtools import tools
+
+    for line in sys.stdin:
+        if line.strip():
+            job = json.loads(line)
+            result = process_file(tools, job["file"], job["output"], args)
+            print(RESULT_PREFIX + json.dumps(result), flush=True)
+
+def process_file(tools, path, output_name, args):
+    result = {"file": path, "ok": True, "timings": {}, "counts": {}}
+    start = time.perf_counter()
+
+    try:
+        with timed(result, "load"):
+            bpy.ops.wm.open_mainfile(filepath=path, load_ui=False)
+            # mesh pointers are reused between files
+            tools.clear_mesh_caches()
+
+        # mesh -> first object using it, which world space snapping goes by
+        meshes = {}
+        for obj in bpy.data.objects:
+            if obj.type == 'MESH':
+                meshes.setdefault(obj.data, obj)
+        result["meshes"] = len(meshes)
+        result["verts"] = sum(len(mesh.vertices) for mesh in meshes)
+
+        for mesh, obj in meshes.items():
+            snapshot = tools.MeshSnapshot(mesh, use_materials=args.image_backend == "material")
+            if not args.selected_only:
+                snapshot.select_everything()
+
+            for op in args.ops:
+                with timed(result, op):
+                    count = operation_functions[op](tools, snapshot, obj, args)
+                result["counts"][op] = result["counts"].get(op, 0) + count
+
+            with timed(result, "write"):
+                snapshot.commit()
+
+        if not args.dry_run:
+            with timed(result, "save"):
+                save_file(output_name, args)
+    except Exception:
+        result["ok"] = False
+        result["error"] = traceback.format_exc().strip().splitlines()[-1]
+
+    result["timings"]["total"] = time.perf_counter() - start
+    return result
+
+@contextlib.contextmanager
+def timed(result, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = result["timings"]
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+def save_file(output_name, args):
+    if args.output_dir:
+        output_path = os.path.join(args.output_dir, output_name)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        bpy.ops.wm.save_as_mainfile(filepath=output_path)
+    else:
+        bpy.ops.wm.save_mainfile()
+
+# ==================================================
+# Operations
+# ==================================================
+
+def run_steps(tools, snapshot, obj, steps):
+    # Drives the steps the operators use to the end, compute requests
+    # included, and returns the counts they made. An error report fails the
+    # file.
+    stats = tools.OperatorStats("batch")
+    with tools.resumed_stats(stats):
+        job = tools.object_steps([(obj, snapshot)], lambda obj, snapshot: steps)
+        try:
+            while True:
+                next(job)
+        except StopIteration as stop:
+            report = stop.value
+    if report and 'ERROR' in report[0]:
+        raise ValueError("{}: {}".format(obj.name, report[1]))
+    return stats.counts
+
+def grid_snap(tools, snapshot, obj, args):
+    axes = [AXES[axis] for axis in args.axes]
+    multiplier = tools.get_grid_multiplier(args.grid_scale, args.grid_subdivisions, not args.grid_major)
+    matrix = tools.get_grid_matrix(bpy.context.scene, obj, args.grid_space.upper())
+    duplicates_mode = 'MERGE' if args.merge_duplicates else 'KEEP'
+    counts = run_steps(tools, snapshot, obj, tools.grid_snap_steps(snapshot, axes, multiplier, duplicates_mode, matrix))
+    if counts.get('duplicates') and not args.selected_only:
+        # welding rereads the mesh, and with it the stored selection
+        snapshot.select_everything()
+    return counts.get('verts', 0)
+
+def smart_align(tools, snapshot, obj, args):
+    angle_tolerance = math.radians(args.angle_tolerance) if args.angle_tolerance is not None else None
+    counts = run_steps(tools, snapshot, obj, tools.smart_align_steps(snapshot, angle_tolerance))
+    return counts.get('edges', 0)
+
+def coplanar_cleanup(tools, snapshot, obj, args):
+    axes = [AXES[axis] for axis in args.axes]
+    counts = run_steps(tools, snapshot, obj, tools.coplanar_cleanup_steps(snapshot, axes, args.tolerance))
+    return counts.get('clusters', 0)
+
+def reassign_image(tools, snapshot, obj, args):
+    if not snapshot.use_materials and snapshot.mesh.uv_textures.active is None:
+        return 0
+
+    count = 0
+    for pair in args.reassign:
+        old_name, new_name = pair.split("=", 1)
+        old_image = bpy.data.images.get(old_name)
+        new_image = bpy.data.images.get(new_name)
+        if old_image is None:
+            continue
+        if new_image is None:
+            raise ValueError("image {} not found".format(new_name))
+        count += tools.reassign_image(snapshot, old_image, new_image)
+    return count
+
+operation_functions = {
+    'grid_snap': grid_snap,
+    'smart_align': smart_align,
+    'coplanar_cleanup': coplanar_cleanup,
+    'reassign_image': reassign_image,
+}
+
+# ==================================================
+# Main
+# ==================================================
+
+def main():
+    argv = get_script_args()
+    args = parse_args(argv)
+    if args.worker:
+        run_worker(args)
+    else:
+        run_controller(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+# the tests import qmtools from the repository root, like the benchmarks
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
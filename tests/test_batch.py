@@ -0,0 +1,28 @@
+# Tests for the parts of qmtools_batch.py that run outside of Blender
+
+import os
+import queue
+
+import qmtools_batch
+
+def test_worker_argv_parses_back_to_the_same_options():
+    args = qmtools_batch.parse_args([
+        "--op", "grid_snap", "--op", "reassign_image", "--reassign=-old=new", "--axes", "xz",
+        "--angle-tolerance", "5", "--merge-duplicates", "--jobs", "3", "--output-dir", "levels",
+        "levels"])
+    worker_args = qmtools_batch.parse_args(qmtools_batch.get_worker_argv(args))
+    assert worker_args.worker
+    assert worker_args.files == []
+    for name in ("ops", "reassign", "axes", "angle_tolerance", "merge_duplicates", "grid_scale", "tolerance"):
+        assert getattr(worker_args, name) == getattr(args, name)
+    # an option value that is also one of the files is kept
+    assert worker_args.output_dir == os.path.abspath("levels")
+
+def test_drive_worker_fails_every_file_when_blender_does_not_start():
+    work = queue.Queue()
+    for path in ("a.blend", "b.blend"):
+        work.put((path, path))
+    results = []
+    qmtools_batch.drive_worker(["/nonexistent/blender"], work, results.append)
+    assert [(result["file"], result["ok"]) for result in results] == [("a.blend", False), ("b.blend", False)]
+    assert work.empty()
@@ -0,0 +1,328 @@
+# Tests for the bpy-free geometry kernels in qmtools.core, run with:
+#
+#   python -m pytest tests
+
+import math
+
+import numpy as np
+
+from qmtools import core
+
+def make_quad_grid(segments):
+    # unit quads on the xy plane, face (row, column) is row * segments + column.
+    # Returns (co, loop_start, loop_total, loop_verts, loop_edges, edges).
+    side = segments + 1
+    x, y = np.meshgrid(np.arange(side), np.arange(side))
+    co = np.stack((x.ravel(), y.ravel(), np.zeros(side * side)), axis=1).astype(np.float32)
+
+    rows, cols = np.meshgrid(np.arange(segments), np.arange(segments), indexing='ij')
+    first = (rows * side + cols).ravel()
+    corners = np.stack((first, first + 1, first + side + 1, first + side), axis=1)
+    loop_verts = corners.ravel().astype(np.int32)
+    loop_total = np.full(segments * segments, 4, dtype=np.int32)
+    loop_start = np.arange(0, len(loop_verts), 4, dtype=np.int32)
+
+    pairs = np.sort(np.stack((loop_verts, corners[:, [1, 2, 3, 0]].ravel()), axis=1), axis=1)
+    keys = pairs[:, 0] * len(co) + pairs[:, 1]
+    unique, loop_edges = np.unique(keys, return_inverse=True)
+    edges = np.stack(np.divmod(unique, len(co)), axis=1).astype(np.int32)
+    return co, loop_start, loop_total, loop_verts, loop_edges.ravel().astype(np.int32), edges
+
+def get_neighbours(offsets, neighbours, face):
+    return sorted(neighbours[offsets[face]:offsets[face + 1]].tolist())
+
+# ==================================================
+# Grid and alignment
+# ==================================================
+
+def test_snap_coords_to_grid_rounds_only_the_given_axes():
+    coords = np.array([[0.26, 0.74, 1.1]])
+    snapped = core.snap_coords_to_grid(coords, (core.X_AXIS_INDEX, core.Y_AXIS_INDEX), 2.0)
+    np.testing.assert_allclose(snapped, [[0.5, 0.5, 1.1]])
+
+def test_snap_coords_to_grid_rounds_in_matrix_space():
+    matrix = np.eye(4)
+    matrix[:3, 3] = (0.25, 0.0, 0.0)
+    snapped = core.snap_coords_to_grid(np.array([[0.1, 0.0, 0.0]]), (core.X_AXIS_INDEX,), 1.0, matrix)
+    # 0.35 in grid space rounds to 0, which is -0.25 in object space
+    np.testing.assert_allclose(snapped, [[-0.25, 0.0, 0.0]])
+
+def test_align_coords_sets_the_target_in_matrix_space():
+    matrix = np.diag((2.0, 2.0, 2.0, 1.0))
+    aligned = core.align_coords(np.array([[1.0, 1.0, 1.0]]), (core.Z_AXIS_INDEX,), (0.0, 0.0, 4.0), matrix)
+    np.testing.assert_allclose(aligned, [[1.0, 1.0, 2.0]])
+
+def test_find_coincident_verts_maps_duplicates_to_the_lowest_index():
+    co = np.array([[0, 0, 0], [1, 0, 0], [0, 0, 0], [-0.0, 0, 0]], dtype=np.float32)
+    duplicates, targets = core.find_coincident_verts(co, np.array([2]))
+    assert duplicates.tolist() == [2, 3]
+    assert targets.tolist() == [0, 0]
+
+def test_find_coincident_verts_ignores_positions_outside_the_selection():
+    co = np.array([[0, 0, 0], [0, 0, 0], [1, 0, 0], [1, 0, 0]], dtype=np.float32)
+    duplicates, targets = core.find_coincident_verts(co, np.array([2]))
+    assert duplicates.tolist() == [3]
+    assert targets.tolist() == [2]
+
+def test_find_coincident_verts_matches_grid_points_after_float_rounding():
+    co = np.array([[0.30000001, 1.0, 0.0], [0.29999998, 1.0, 0.0], [0.29999998, 1.5, 0.0]])
+    duplicates, targets = core.find_coincident_verts(co, np.array([1]), (core.X_AXIS_INDEX,), 10.0)
+    # the third vertex is somewhere else on y, which was not snapped
+    assert duplicates.tolist() == [1]
+    assert targets.tolist() == [0]
+
+def test_find_coincident_verts_compares_grid_points_in_matrix_space():
+    matrix = np.diag((0.5, 0.5, 0.5, 1.0))
+    # the first two were snapped to 1 in grid space, the other two never moved
+    co = np.array([[2.0, 0.0, 0.0], [2.0000004, 0.0, 0.0], [2.6, 0.0, 0.0], [2.0000001, 0.0, 0.0]])
+    duplicates, targets = core.find_coincident_verts(
+        co, np.arange(2), (core.X_AXIS_INDEX, core.Y_AXIS_INDEX, core.Z_AXIS_INDEX), 1.0, matrix)
+    # 1.3 is off the grid point, 1.00000005 is on it up to float rounding
+    assert duplicates.tolist() == [1, 3]
+    assert targets.tolist() == [0, 0]
+
+def test_find_coincident_verts_leaves_unmoved_vertices_off_the_grid_point_alone():
+    co = np.array([[0.0, 5.0, 2.0], [0.45, 5.0, 2.0]])
+    duplicates, targets = core.find_coincident_verts(co, np.array([0]), (core.X_AXIS_INDEX,), 1.0)
+    assert duplicates.tolist() == []
+    assert targets.tolist() == []
+
+def test_snap_near_grid_coords_measures_in_matrix_space():
+    matrix = np.diag((2.0, 2.0, 2.0, 1.0))
+    co = np.array([[0.4999, 0.25, 0.0], [0.3, 0.5, 0.0]])
+    mask = core.find_near_grid_coords(co, 1.0, 0.001, matrix)
+    # 0.25 and 0.3 are 0.5 and 0.6 in grid space, nowhere near a grid line
+    assert mask.tolist() == [[True, False, False], [False, False, False]]
+    verts, coords = core.snap_near_grid_coords(co, 1.0, 0.001, matrix)
+    assert verts.tolist() == [0]
+    np.testing.assert_allclose(coords, [[0.5, 0.25, 0.0]])
+
+# ==================================================
+# Clustering
+# ==================================================
+
+def test_cluster_coords_moves_clusters_to_their_mean():
+    coords = np.array([[0.0], [0.0004], [1.0], [1.0003], [5.0]])
+    clustered, collapsed = core.cluster_coords(coords, (core.X_AXIS_INDEX,), 0.001)
+    np.testing.assert_allclose(clustered[:, 0], [0.0002, 0.0002, 1.00015, 1.00015, 5.0])
+    assert collapsed == 2
+
+def test_cluster_coords_snaps_clusters_to_the_grid():
+    coords = np.array([[0.9996, 2.0], [1.0003, 2.0]])
+    clustered, collapsed = core.cluster_coords(coords, (core.X_AXIS_INDEX,), 0.001, multiplier=1.0)
+    np.testing.assert_allclose(clustered, [[1.0, 2.0], [1.0, 2.0]])
+    assert collapsed == 1
+
+def test_cluster_coords_snaps_clusters_to_the_grid_in_matrix_space():
+    matrix = np.eye(4)
+    matrix[0, 3] = 0.25
+    coords = np.array([[0.7496, 2.0, 0.0], [0.7503, 2.0, 0.0]])
+    clustered, collapsed = core.cluster_coords(coords, (core.X_AXIS_INDEX,), 0.001, 1.0, matrix)
+    np.testing.assert_allclose(clustered, [[0.75, 2.0, 0.0], [0.75, 2.0, 0.0]])
+    assert collapsed == 1
+
+def test_cluster_coords_does_not_chain_a_ramp_into_one_value():
+    tolerance = 0.001
+    ramp = np.arange(0.0, 1.0, 0.0009)
+    coords = np.stack((ramp, np.zeros(len(ramp)), np.zeros(len(ramp))), axis=1)
+    clustered, collapsed = core.cluster_coords(coords, (core.X_AXIS_INDEX,), tolerance)
+    assert len(np.unique(clustered[:, 0])) >= len(ramp) // 2
+    assert np.abs(clustered[:, 0] - ramp).max() <= tolerance / 2
+    assert clustered[-1, 0] > 0.99
+
+def test_get_value_clusters_span_at_most_the_tolerance():
+    values = np.random.RandomState(0).uniform(0.0, 0.1, 2000)
+    labels, order, starts = core.get_value_clusters(values, 0.001)
+    spans = np.bincount(labels, minlength=len(starts))
+    for label in range(len(starts)):
+        members = values[labels == label]
+        assert members.max() - members.min() <= 0.001
+    assert spans.sum() == len(values)
+
+def test_cluster_coords_without_coords():
+    clustered, collapsed = core.cluster_coords(np.zeros((0, 3)), (core.X_AXIS_INDEX,), 0.001)
+    assert clustered.shape == (0, 3)
+    assert collapsed == 0
+
+# ==================================================
+# Smart align
+# ==================================================
+
+def test_union_find_labels_with_the_smallest_node():
+    pairs = np.array([[2, 1], [1, 0], [5, 4]])
+    assert core.get_union_find_labels(6, pairs).tolist() == [0, 0, 0, 3, 4, 4]
+
+def test_union_find_labels_a_long_chain_in_any_order():
+    count = 50
+    chain = np.stack((np.arange(1, count), np.arange(count - 1)), axis=1)
+    shuffled = chain[np.random.RandomState(0).permutation(len(chain))]
+    assert (core.get_union_find_labels(count, shuffled) == 0).all()
+
+def test_solve_smart_align_straightens_an_l_shape():
+    co = np.array([[0.0, 0.0, 0.0], [1.0, 0.02, 0.0], [1.01, 1.0, 0.0]])
+    verts, coords = core.solve_smart_align(co, np.array([[0, 1], [1, 2]]))
+    assert verts.tolist() == [0, 1, 2]
+    np.testing.assert_allclose(coords, [[0.0, 0.01, 0.0], [1.005, 0.01, 0.0], [1.005, 1.0, 0.0]])
+
+def test_solve_smart_align_leaves_diagonals_outside_the_tolerance():
+    co = np.array([[0.0, 0.0, 0.0], [1.0, 0.9, 0.0]])
+    verts, coords = core.solve_smart_align(co, np.array([[0, 1]]), angle_tolerance=math.radians(10))
+    np.testing.assert_allclose(coords, co)
+
+# ==================================================
+# Face adjacency
+# ==================================================
+
+def test_build_face_adjacency_links_faces_sharing_an_edge():
+    co, loop_start, loop_total, loop_verts, loop_edges, edges = make_quad_grid(2)
+    offsets, neighbours = core.build_face_adjacency(loop_total, loop_edges)
+    assert [get_neighbours(offsets, neighbours, face) for face in range(4)] == [[1, 2], [0, 3], [0, 3], [1, 2]]
+
+def test_build_face_adjacency_links_every_face_around_a_non_manifold_edge():
+    # three triangles on edge 0
+    loop_total = np.array([3, 3, 3], dtype=np.int32)
+    loop_edges = np.array([0, 1, 2, 0, 3, 4, 0, 5, 6], dtype=np.int32)
+    offsets, neighbours = core.build_face_adjacency(loop_total, loop_edges)
+    assert [get_neighbours(offsets, neighbours, face) for face in range(3)] == [[1, 2], [0, 2], [0, 1]]
+
+def test_select_linked_faces_stays_inside_the_given_faces():
+    co, loop_start, loop_total, loop_verts, loop_edges, edges = make_quad_grid(3)
+    offsets, neighbours = core.build_face_adjacency(loop_total, loop_edges)
+    # the top row and a far corner that only touches it through other faces
+    faces = np.array([0, 1, 2, 8])
+    assert core.select_linked_faces(offsets, neighbours, np.array([0]), faces).tolist() == [0, 1, 2]
+    assert core.select_linked_faces(offsets, neighbours, np.array([8]), faces).tolist() == [8]
+
+def test_select_linked_faces_ignores_seeds_outside_the_given_faces():
+    co, loop_start, loop_total, loop_verts, loop_edges, edges = make_quad_grid(3)
+    offsets, neighbours = core.build_face_adjacency(loop_total, loop_edges)
+    assert core.select_linked_faces(offsets, neighbours, np.array([4]), np.array([0, 1])).tolist() == []
+
+# ==================================================
+# UV islands
+# ==================================================
+
+def test_get_uv_islands_joins_faces_sharing_uvs():
+    co, loop_start, loop_total, loop_verts, loop_edges, edges = make_quad_grid(2)
+    loop_uv = co[loop_verts, :2]
+    islands = core.get_uv_islands(loop_start, loop_total, loop_verts, loop_uv)
+    assert islands.tolist() == [0, 0, 0, 0]
+
+def test_get_uv_islands_splits_at_uv_seams():
+    co, loop_start, loop_total, loop_verts, loop_edges, edges = make_quad_grid(2)
+    loop_uv = co[loop_verts, :2].copy()
+    loop_uv[4:8] += 2.0  # face 1 unwrapped on its own
+    islands = core.get_uv_islands(loop_start, loop_total, loop_verts, loop_uv)
+    assert islands[0] == islands[2] == islands[3]
+    assert islands[1] != islands[0]
+
+def test_get_first_equal_rows_picks_one_row_per_value():
+    keys = np.array([[1, 2, 3], [4, 5, 6], [1, 2, 3], [4, 5, 7]], dtype=np.int32)
+    firsts = core.get_first_equal_rows(keys)
+    assert firsts[0] == firsts[2]
+    assert len(set(firsts.tolist())) == 3
+    assert (keys[firsts] == keys).all()
+
+def test_select_island_faces_keeps_faces_in_seeded_islands():
+    islands = np.array([0, 0, 1, 2, 1])
+    faces = core.select_island_faces(islands, np.array([2]), np.arange(5))
+    assert faces.tolist() == [2, 4]
+
+# ==================================================
+# Image index
+# ==================================================
+
+def test_image_face_index_merges_slots_with_the_same_image():
+    index = core.ImageFaceIndex(['a', 'b', 'a'], np.array([0, 1, 2, 1]))
+    assert index.get_faces('a').tolist() == [0, 2]
+    assert index.get_faces('b').tolist() == [1, 3]
+    assert index.count('missing') == 0
+
+def test_image_face_index_reassign():
+    index = core.ImageFaceIndex(['a', 'b'], np.array([0, 1, 0, 1]))
+    index.reassign(np.array([0]), 'b')
+    index.reassign(np.array([3]), 'c')
+    assert index.get_faces('a').tolist() == [2]
+    assert index.get_faces('b').tolist() == [0, 1]
+    assert index.get_faces('c').tolist() == [3]
+
+# ==================================================
+# Cube projection
+# ==================================================
+
+def test_get_projection_axes_breaks_ties_towards_z():
+    normals = np.array([[1.0, 0.0, 0.0], [0.0, -0.9, 0.1], [0.0, 0.0, -1.0], [1.0, 1.0, 1.0], [1.0, 1.0, 0.0]])
+    assert core.get_projection_axes(normals).tolist() == [0, 1, 2, 2, 1]
+
+def test_get_cube_projection_uses_the_other_two_axes():
+    co = np.array([[1.0, 2.0, 3.0]])
+    normals = np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]])
+    loop_verts = np.zeros(3, dtype=np.int32)
+    base = core.get_cube_projection(co, normals, loop_verts, np.arange(3))
+    assert base.tolist() == [[2.0, 3.0], [1.0, 3.0], [1.0, 2.0]]
+
+def test_scale_cube_projection_keeps_each_face_in_the_first_tile():
+    base = np.array([[10.2, -3.4], [11.2, -3.4], [20.0, 7.0]])
+    uvs = core.scale_cube_projection(base, np.array([0, 0, 1]), np.array([0, 2]), 1.0)
+    assert (uvs[[0, 2]] >= 0).all() and (uvs[[0, 2]] < 1).all()
+    # loops keep their offset from the first loop of their face
+    np.testing.assert_allclose(uvs[1] - uvs[0], (uvs[1] - uvs[0]).round(5))
+
+def test_scale_cube_projection_matches_blenders_cube_project():
+    # uv.cube_project puts a loop at 0.5 + 0.5 * cube_size * co
+    base = np.array([[0.0, 0.0], [1.0, 0.5]])
+    for cube_size in (0.5, 1.0, 2.0):
+        uvs = core.scale_cube_projection(base, np.array([0, 0]), np.array([0]), cube_size)
+        np.testing.assert_allclose(uvs, [[0.5, 0.5], [0.5 + 0.5 * cube_size, 0.5 + 0.25 * cube_size]])
+
+# ==================================================
+# Areas
+# ==================================================
+
+def test_get_face_vector_areas_of_unit_quads():
+    co, loop_start, loop_total, loop_verts, loop_edges, edges = make_quad_grid(2)
+    vector_areas = core.get_face_vector_areas(co, loop_start, loop_total, loop_verts)
+    np.testing.assert_allclose(vector_areas, [[0.0, 0.0, 1.0]] * 4)
+
+def test_transform_vector_areas_scales_the_area():
+    matrix = np.diag((2.0, 3.0, 1.0, 1.0))
+    areas = core.transform_vector_areas(matrix, np.array([[0.0, 0.0, 1.0]]))
+    np.testing.assert_allclose(areas, [[0.0, 0.0, 6.0]])
+
+def test_get_face_uv_areas_of_a_half_size_unwrap():
+    co, loop_start, loop_total, loop_verts, loop_edges, edges = make_quad_grid(2)
+    uv_areas = core.get_face_uv_areas(loop_start, loop_total, co[loop_verts, :2] * 0.5)
+    np.testing.assert_allclose(uv_areas, [0.25] * 4)
+
+# ==================================================
+# Batching and texel density
+# ==================================================
+
+def test_get_reversed_loops_flips_every_face():
+    assert core.get_reversed_loops(np.array([3, 2])).tolist() == [2, 1, 0, 4, 3]
+
+def test_get_submesh_renumbers_vertices_in_original_order():
+    co, loop_start, loop_total, loop_verts, loop_edges, edges = make_quad_grid(2)
+    verts, loops, totals, submesh_loop_verts = core.get_submesh(loop_start, loop_total, loop_verts, np.array([3]))
+    assert verts.tolist() == [4, 5, 7, 8]
+    assert submesh_loop_verts.tolist() == [0, 1, 3, 2]
+
+def test_merge_submeshes_keeps_the_uvs_when_a_part_has_none():
+    triangle = np.zeros((3, 3)), np.array([3]), np.array([0, 1, 2])
+    uvs = np.array([[0, 0], [1, 0], [0, 1]], dtype=np.float32)
+    co, loop_total, loop_verts, loop_uv, face_smooth = core.merge_submeshes([
+        triangle + (uvs, np.array([True])), triangle + (None, np.array([False]))])
+    assert loop_verts.tolist() == [0, 1, 2, 3, 4, 5]
+    assert loop_uv.tolist() == uvs.tolist() + [[0, 0]] * 3
+    assert core.merge_submeshes([triangle + (None, np.array([False]))])[3] is None
+
+def test_get_weighted_median_skips_values_without_weight():
+    values = np.array([1.0, 2.0, np.nan, 100.0])
+    weights = np.array([1.0, 3.0, 5.0, 0.0])
+    assert core.get_weighted_median(values, weights) == 2.0
+    assert math.isnan(core.get_weighted_median(values, np.zeros(4)))
+
+def test_get_group_uv_scales_reach_the_target_density():
+    # one unit face with a quarter of a 64x64 image, 32 px per unit
+    scales = core.get_group_uv_scales(np.array([0]), np.array([1.0]), np.array([0.25]), np.array([4096.0]), 64.0)
+    np.testing.assert_allclose(scales, [2.0])
@@ -0,0 +1,103 @@
+# Tests for qmtools.tools. They need bpy, so outside of Blender they are
+# skipped. Run them with Blender's Python:
+#
+#   blender --background --factory-startup --python-expr \
+#       "import sys, pytest; sys.exit(pytest.main(['tests']))"
+
+import numpy as np
+import pytest
+
+bpy = pytest.importorskip('bpy')
+mathutils = pytest.importorskip('mathutils')
+
+from qmtools import tools
+
+@pytest.fixture
+def quad_mesh():
+    # two quads side by side, without material slots
+    mesh = bpy.data.meshes.new("qmtools_test")
+    mesh.from_pydata([(0, 0, 0), (1, 0, 0), (2, 0, 0), (0, 1, 0), (1, 1, 0), (2, 1, 0)], [],
+                     [(0, 1, 4, 3), (1, 2, 5, 4)])
+    mesh.update()
+    yield mesh
+    bpy.data.meshes.remove(mesh)
+    tools.clear_mesh_caches()
+
+@pytest.fixture
+def image():
+    image = bpy.data.images.new("qmtools_test", 4, 4)
+    yield image
+    bpy.data.images.remove(image)
+
+def test_assign_image_without_material_slots_leaves_the_other_faces_alone(quad_mesh, image):
+    snapshot = tools.MeshSnapshot(quad_mesh)
+    assert tools.get_image_face_index(snapshot).get_faces(None).tolist() == [0, 1]
+
+    tools.assign_image_to_faces(snapshot, np.array([1]), image)
+    snapshot.commit()
+
+    assert quad_mesh.materials[0] is None
+    assert tools.get_material_image(quad_mesh.materials[1]) == image
+    assert [polygon.material_index for polygon in quad_mesh.polygons] == [0, 1]
+
+    # the index kept by the assignment and a freshly built one agree
+    kept = tools.get_image_face_index(tools.MeshSnapshot(quad_mesh))
+    tools.clear_mesh_caches()
+    built = tools.get_image_face_index(tools.MeshSnapshot(quad_mesh))
+    for index in (kept, built):
+        assert index.get_faces(None).tolist() == [0]
+        assert index.get_faces(image.name).tolist() == [1]
+
+def test_normalize_texel_density_scales_partly_selected_islands_whole(quad_mesh, image):
+    # one island, the quads share the uvs of their shared edge
+    tools.ensure_uv_layer(quad_mesh)
+    uvs = np.array([(0, 0), (1, 0), (1, 1), (0, 1), (1, 0), (2, 0), (2, 1), (1, 1)], dtype=np.float32)
+    quad_mesh.uv_layers.active.data.foreach_set('uv', uvs.ravel())
+    snapshot = tools.MeshSnapshot(quad_mesh)
+    tools.assign_image_to_faces(snapshot, np.array([0, 1]), image)
+    snapshot.commit()
+    quad_mesh.polygons.foreach_set('select', [True, False])
+
+    # 4x4 pixels on a unit quad with a unit uv square is 4 px/unit
+    snapshot = tools.MeshSnapshot(quad_mesh)
+    assert tools.normalize_mesh_texel_density(snapshot, mathutils.Matrix.Identity(4), 8.0) == 1
+    snapshot.commit()
+
+    scaled = np.zeros(len(uvs) * 2, dtype=np.float32)
+    quad_mesh.uv_layers.active.data.foreach_get('uv', scaled)
+    center = uvs.mean(axis=0)
+    np.testing.assert_allclose(scaled.reshape(-1, 2), center + (uvs - center) * 2, atol=1e-6)
+
+def test_batch_groups_keep_materials_without_an_image(quad_mesh, image):
+    plain = bpy.data.materials.new("qmtools_plain")
+    quad_mesh.materials.append(plain)
+    snapshot = tools.MeshSnapshot(quad_mesh)
+    tools.assign_image_to_faces(snapshot, np.array([1]), image)
+    snapshot.commit()
+
+    groups = tools.get_batch_groups(tools.MeshSnapshot(quad_mesh))
+    assert [(key, faces.tolist()) for key, faces in groups] == [
+        ((None, plain.name), [0]), ((image.name, None), [1])]
+    bpy.data.materials.remove(plain)
+
+def test_edit_mesh_rollback_restores_the_selection_of_shared_verts(quad_mesh):
+    obj = bpy.data.objects.new("qmtools_test", quad_mesh)
+    tools.link_object(bpy.context, obj)
+    quad_mesh.vertices.foreach_set('select', [True, True, False, True, True, False])
+    quad_mesh.polygons.foreach_set('select', [True, False])
+    bpy.context.scene.objects.active = obj
+    bpy.ops.object.mode_set(mode='EDIT')
+    try:
+        bpy.context.tool_settings.mesh_select_mode = (True, False, False)
+        snapshot = tools.EditMeshSnapshot(quad_mesh)
+        snapshot.set_values('face_select', [1], True)
+        steps = snapshot.commit_steps()
+        next(steps)
+        snapshot.rollback()
+        steps.close()
+
+        assert [face.select for face in snapshot.bm.faces] == [True, False]
+        assert [vert.select for vert in snapshot.bm.verts] == [True, True, False, True, True, False]
+    finally:
+        bpy.ops.object.mode_set(mode='OBJECT')
+        bpy.data.objects.remove(obj, do_unlink=True)